@@ -0,0 +1,33 @@
+import numpy as np
+from hitlog import HitLog
+
+# Bin sizes, in seconds, that auto_bin_size chooses from.
+BIN_SIZES = (0.5, 1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def auto_bin_size(duration, max_bins=150):
+    """The smallest bin size in BIN_SIZES that splits duration seconds into at most max_bins bins."""
+    for bin_size in BIN_SIZES:
+        if duration/bin_size <= max_bins:
+            return bin_size
+    return duration/max_bins
+
+
+def bin_hits(log, spell_names, bin_size, end=None):
+    """Damage per second of the hits of spell_names in each bin_size-second bucket of a HitLog.
+
+    Returns the start time of every bucket from zero to end, which defaults to the last hit, and the DPS in it."""
+    if end is None:
+        end = float(log.times[-1]) if len(log) else 0.0
+    bin_count = int(end//bin_size) + 1
+    times, damages = log.for_spells(*spell_names)
+    totals = np.bincount((times//bin_size).astype(np.int64), weights=damages, minlength=bin_count)[:bin_count]
+    return np.arange(bin_count)*bin_size, totals/bin_size
+
+
+def hits_in_window(log, start, end):
+    """A new HitLog with only the raw hits that land between start and end seconds, for drilling into a bin."""
+    mask = (log.times >= start) & (log.times <= end)
+    window = HitLog(log.spell_names, capacity=max(int(mask.sum()), 1))
+    window.extend(log.times[mask], log.ids[mask], log.damages[mask], log.crits[mask])
+    return window
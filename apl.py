@@ -0,0 +1,145 @@
+import json
+from spelltable import SPELL_TABLE
+
+
+def table_actions(table):
+    """What casting each castable spell of table does: the index into Simulation.ready holding the time the spell is
+    ready again (None for spells that are always ready), the event the cast schedules, the spell id whose cast time
+    delays that event (None for instants) and the name shown to users."""
+    actions = {}
+    for spell in table.castable():
+        ready = table.ready_index(spell)
+        if not table.cooldowns[spell] and table.applies[spell] is None:
+            ready = None
+        actions[table.keys[spell]] = (ready, table.events[spell], spell if table.cast_times[spell] else None,
+                                      table.labels[spell])
+    return actions
+
+
+def table_conditions(table):
+    """Conditions an entry can require on top of its spell being ready, as expressions in the Simulation sim and the
+    current time now: <spell>_on_cooldown for spells with a cooldown, <spell>_active and <spell>_inactive for spells
+    that apply a debuff or a periodic effect."""
+    conditions = {}
+    for spell in table.castable():
+        key = table.keys[spell]
+        if table.debuff_durations[spell]:
+            conditions[f'{key}_active'] = 'now <= sim.debuff_end'
+            conditions[f'{key}_inactive'] = 'now > sim.debuff_end'
+        elif table.applies[spell] is not None:
+            conditions[f'{key}_active'] = f'now < sim.ready[{table.applies[spell]}]'
+            conditions[f'{key}_inactive'] = f'now >= sim.ready[{table.applies[spell]}]'
+        if table.cooldowns[spell]:
+            conditions[f'{key}_on_cooldown'] = f'now < sim.ready[{spell}]'
+    return conditions
+
+
+ACTIONS = table_actions(SPELL_TABLE)
+CONDITIONS = table_conditions(SPELL_TABLE)
+
+# The rotation the app has always used. SW: Pain is only cast when it is no longer in effect.
+DEFAULT_PRIORITY = ('schism', 'pain', 'penance', 'solace', 'divine_star', 'smite')
+
+
+class PriorityList:
+    """A rotation as data: spells in priority order, each cast when it is ready and its conditions hold.
+
+    Entries are spell names or {'spell': name, 'if': [condition, ...]} mappings, the shape load reads from JSON. They
+    are validated here, so a bad rotation fails when it is loaded rather than mid-fight. A PriorityList never changes,
+    so it can be shared by any number of Simulations and key the schedule cache. Spells and conditions come from
+    table, a SpellTable that defaults to the one in spells.json; Simulations using the list need the same table."""
+    __slots__ = ('entries', 'table', 'actions', 'conditions', 'function')
+
+    def __init__(self, entries=DEFAULT_PRIORITY, table=None):
+        if table is None or table is SPELL_TABLE:
+            self.table, self.actions, self.conditions = SPELL_TABLE, ACTIONS, CONDITIONS
+        else:
+            self.table, self.actions, self.conditions = table, table_actions(table), table_conditions(table)
+        compiled = []
+        for entry in entries:
+            if isinstance(entry, str):
+                spell, conditions = entry, ()
+            else:
+                spell, conditions = entry['spell'], tuple(entry.get('if', ()))
+            if spell not in self.actions:
+                raise ValueError(f'Unknown spell {spell!r} in the priority list. '
+                                 f'Use one of {", ".join(self.actions)}.')
+            for condition in conditions:
+                if condition not in self.conditions:
+                    raise ValueError(f'Unknown condition {condition!r} in the priority list. '
+                                     f'Use one of {", ".join(self.conditions)}.')
+            compiled.append((spell, conditions))
+        if not compiled:
+            raise ValueError('The priority list is empty.')
+        self.entries = tuple(compiled)
+        self.function = None
+
+    @classmethod
+    def load(cls, path, table=None):
+        """Reads a priority list from a JSON file holding a list of entries."""
+        with open(path) as apl_file:
+            return cls(json.load(apl_file), table)
+
+    def __eq__(self, other):
+        return isinstance(other, PriorityList) and self.entries == other.entries and self.table is other.table
+
+    def __hash__(self):
+        return hash((self.entries, id(self.table)))
+
+    def describe(self):
+        """The rotation in words, e.g. 'Schism, SW: Pain, Smite'."""
+        return ', '.join(self.actions[spell][3] + (f' ({" and ".join(conditions)})' if conditions else '')
+                         for spell, conditions in self.entries)
+
+    def source(self):
+        """Python source of the function that compile builds."""
+        lines = ['def next_spell(sim):',
+                 '    now = sim.now',
+                 '    if now >= sim.apl_ready_bound:',
+                 '        bound = INF']
+        filler = None
+        for spell, conditions in self.entries:
+            ready, kind, cast_spell, _ = self.actions[spell]
+            cast_time = f' + sim.cast_times[{cast_spell}]' if cast_spell is not None else ''
+            cast = ['        sim.apl_ready_bound = now',
+                    f'        sim.queue.schedule({kind!r}, now{cast_time})',
+                    '        return']
+            if ready is None and not conditions:
+                filler = cast[1:2]
+                break
+            indent = ''
+            if ready is not None:
+                lines += [f'        ready = sim.ready[{ready}]',
+                          f'        if now >= ready:']
+                indent = '    '
+            if conditions:
+                lines.append(f'        {indent}if {" and ".join(f"({self.conditions[name]})" for name in conditions)}:')
+                lines += ['    ' + indent + line for line in cast]
+                lines.append(f'        {indent}bound = now')
+            else:
+                lines += [indent + line for line in cast]
+            if ready is not None:
+                lines += ['        elif ready < bound:',
+                          '            bound = ready']
+        lines.append('        sim.apl_ready_bound = bound')
+        if filler is None:
+            # Nothing can be cast, so the character waits out a GCD and looks again.
+            filler = ["        sim.queue.schedule('gcd_end', now + sim.gcd)"]
+        lines += [line[4:] for line in filler]
+        return '\n'.join(lines) + '\n'
+
+    def compile(self):
+        """Compiles the list into a next_spell(sim) function, the if/elif chain a hand-written rotation would be.
+
+        Ready times only move later until the next reset, so when a pass falls through to the filler, the earliest
+        ready time it saw is kept in sim.apl_ready_bound. Until the clock reaches it, the filler is cast at once
+        without testing any entry. Casting anything else leaves the entries below it untested, so the bound is dropped.
+        The function is built once per PriorityList and shared by every Simulation using it."""
+        if self.function is None:
+            namespace = {'INF': float('inf')}
+            exec(self.source(), namespace)
+            self.function = namespace['next_spell']
+        return self.function
+
+
+DEFAULT_APL = PriorityList()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import montecarlo
+from engine import Simulation, Stats
+from montecarlo import event_kill_times, run_batch
+from rng import CritStream
+from schedule import schedule_cache
+from sinks import ColumnarSink
+
+STATS = (7189, 1273, 473, 716, 331)
+MOB_HPS = (100000, 500000, 1000000, 5000000)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+class Metric:
+    """One benchmark result. higher_is_better tells which way a change counts as a regression."""
+    def __init__(self, name, value, unit, higher_is_better=False):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def change(self, baseline):
+        """Relative change against a baseline value, positive when this result is worse."""
+        if not baseline:
+            return 0.0
+        if self.higher_is_better:
+            return (baseline - self.value)/baseline
+        return (self.value - baseline)/baseline
+
+
+def best_time(fn, repeat=5, min_time=0.05):
+    """Seconds per call of fn in the fastest of repeat rounds, the one least disturbed by the rest of the machine.
+
+    Each round calls fn often enough to last min_time, so sub-millisecond calls are not lost in timer noise."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best/number
+
+
+def peak_memory(fn):
+    """Peak bytes allocated by Python while fn runs."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def count_events(stats, mob_hp, seed):
+    """How many events one seeded run handles, counted with wrapped handlers outside of any timing."""
+    sim = Simulation(stats, rng=CritStream(seed))
+    count = [0]
+
+    def counted(handler):
+        def wrapper():
+            count[0] += 1
+            handler()
+        return wrapper
+
+    for kind, handler in list(sim.queue.handlers.items()):
+        sim.queue.handlers[kind] = counted(handler)
+    sim.kill_one(mob_hp)
+    return count[0]
+
+
+def kill_one_time(stats, mob_hp, seed):
+    """Seconds per kill_one of a mob with mob_hp hitpoints, replaying the same seeded run from a reset Simulation."""
+    sim = Simulation(stats)
+    key = CritStream(seed).key
+
+    def run():
+        sim.reset()
+        sim.rng = CritStream(key=key)
+        sim.kill_one(mob_hp)
+    return best_time(run)
+
+
+def event_loop_metrics(ratings, seed):
+    stats = Stats(*ratings)
+    mob_hp = 1000000
+    events = count_events(stats, mob_hp, seed)
+    return [Metric('event_loop.events_per_second', events/kill_one_time(stats, mob_hp, seed), 'events/s', True)]
+
+
+def kill_one_metrics(ratings, seed):
+    stats = Stats(*ratings)
+    return [Metric(f'kill_one.{mob_hp}', kill_one_time(stats, mob_hp, seed)*1e3, 'ms') for mob_hp in MOB_HPS]
+
+
+def memory_metrics(ratings, seed, iterations=10000):
+    stats = Stats(*ratings)
+    mob_hp = 500000
+    return [Metric('memory.event_run', peak_memory(lambda: Simulation(stats, rng=CritStream(seed)).kill_one(mob_hp)),
+                   'bytes'),
+            Metric('memory.event_run_with_hits',
+                   peak_memory(lambda: Simulation(stats, sink=ColumnarSink(), rng=CritStream(seed)).kill_one(mob_hp)),
+                   'bytes'),
+            Metric('memory.vectorized_per_run',
+                   peak_memory(lambda: run_batch(stats, iterations, mob_hp, seed))/iterations, 'bytes')]
+
+
+def throughput_metrics(ratings, seed):
+    stats = Stats(*ratings)
+    mob_hp = 500000
+    # Warms the schedule cache, so the vectorized figure is the steady state the Dash app and optimizer see.
+    run_batch(stats, 10, mob_hp, seed)
+    return [Metric('throughput.vectorized', 10000/best_time(lambda: run_batch(stats, 10000, mob_hp, seed)), 'runs/s',
+                   True),
+            Metric('throughput.event', 200/best_time(lambda: event_kill_times(stats, 200, mob_hp, seed), repeat=3),
+                   'runs/s', True)]
+
+
+def dash_metrics(ratings, seed):
+    """make_dash latency on a cold cache, split into simulate_dash and the figure build that follows it."""
+    import dashversion
+
+    def cold(fn):
+        def run():
+            dashversion.dash_cache.clear()
+            schedule_cache.clear()
+            return fn()
+        return run
+
+    simulation = dashversion.simulate_dash(*ratings, seed=seed)
+    simulate = best_time(cold(lambda: dashversion.simulate_dash(*ratings, seed=seed)))
+    build = best_time(cold(lambda: dashversion.make_dash(*ratings, seed=seed, simulation=simulation)))
+    total = best_time(cold(lambda: dashversion.make_dash(*ratings, seed=seed)))
+    return [Metric('make_dash.simulation', simulate*1e3, 'ms'),
+            Metric('make_dash.figure', build*1e3, 'ms'),
+            Metric('make_dash.total', total*1e3, 'ms')]
+
+
+SUITES = {'event_loop': event_loop_metrics,
+          'kill_one': kill_one_metrics,
+          'memory': memory_metrics,
+          'throughput': throughput_metrics,
+          'make_dash': dash_metrics}
+
+
+def run_suites(names=None, ratings=STATS, seed=0):
+    """Runs the named suites, or all of them, for one stat profile and returns their metrics.
+
+    The result store is switched off meanwhile, so that every seeded batch is simulated rather than read back."""
+    metrics = []
+    result_store, montecarlo.result_store = montecarlo.result_store, None
+    try:
+        for name in names or SUITES:
+            metrics.extend(SUITES[name](ratings, seed))
+    finally:
+        montecarlo.result_store = result_store
+    return metrics
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(metrics, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    baseline.update({metric.name: metric.value for metric in metrics})
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+
+def report(metrics, baseline, threshold, stream=sys.stdout):
+    """Prints every metric next to its baseline and returns the names of those that got worse by more than
+    threshold."""
+    regressions = []
+    for metric in metrics:
+        line = f'{metric.name:34} {metric.value:>16,.2f} {metric.unit}'
+        if metric.name in baseline:
+            change = metric.change(baseline[metric.name])
+            line += f'  ({abs(change):.1%} {"worse" if change > 0 else "better"} than {baseline[metric.name]:,.2f})'
+            if change > threshold:
+                regressions.append(metric.name)
+                line += '  REGRESSION'
+        stream.write(line + '\n')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the simulator and compares the results to a baseline.')
+    parser.add_argument('suites', nargs='*', help=f'suites to run, all by default: {", ".join(SUITES)}')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown beyond which a metric is flagged, 0.10 by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.suites if name not in SUITES]
+    if unknown:
+        parser.error(f'unknown suite(s): {", ".join(unknown)}')
+
+    metrics = run_suites(args.suites, seed=args.seed)
+    regressions = report(metrics, load_baseline(args.baseline), args.threshold)
+    if args.save:
+        save_baseline(metrics, args.baseline)
+        print(f'Saved the baseline to {args.baseline}.')
+    elif regressions:
+        print(f'{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from engine import PROFILE_FIELDS, SPELL_NAMES, Stats
+from montecarlo import MODES, run_batch
+from schedule import cached_schedule
+
+# Limits on one request, so a single call cannot tie up the pool for hours.
+MAX_PROFILES = 1000
+MAX_ITERATIONS = 100000
+# Schedules and kill-time chunks grow with the number of hits a kill takes, about one per 8,000 HP.
+MAX_MOB_HP = 50000000
+# Settings a request may give once for every profile and each profile may override.
+DEFAULTS = {'iterations': 1000, 'seed': 0, 'mob_hp': 500000, 'precision': None, 'mode': 'vectorized'}
+WORKERS = int(os.environ.get('WOWSIM_BULK_WORKERS', '2'))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def worker_pool():
+    """The process pool bulk requests share, started on first use so that importing this module costs nothing."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS)
+        return _pool
+
+
+def discard_pool(pool):
+    """Drops pool once a worker has died in it, so that the next request gets a working one from worker_pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_whole_number(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_jobs(body):
+    """Validates a bulk request body and returns one job per profile, with the request's defaults filled in.
+
+    The body is {"profiles": [...], ...} where each profile is one parse_job takes. Settings at the top level apply to
+    every profile that does not give its own. Raises ValueError with a message fit for the client."""
+    if not isinstance(body, dict) or not isinstance(body.get('profiles'), list):
+        raise ValueError('The body must be a JSON object with a "profiles" list.')
+    profiles = body['profiles']
+    if not profiles:
+        raise ValueError('"profiles" is empty.')
+    if len(profiles) > MAX_PROFILES:
+        raise ValueError(f'At most {MAX_PROFILES} profiles can be simulated per request.')
+    defaults = {name: body.get(name, value) for name, value in DEFAULTS.items()}
+    return [parse_job(index, profile, defaults) for index, profile in enumerate(profiles)]
+
+
+def parse_job(index, profile, defaults=None):
+    """Validates one profile and returns its job: the settings of defaults, which fall back to DEFAULTS, overridden
+    by those the profile gives.
+
+    A profile holds the five ratings named as in PROFILE_FIELDS, an optional "id" that is echoed back, and optionally
+    any of the DEFAULTS settings. Raises ValueError with a message fit for the client."""
+    if not isinstance(profile, dict):
+        raise ValueError(f'Profile {index} is not an object.')
+    defaults = DEFAULTS if defaults is None else dict(DEFAULTS, **defaults)
+    job = {name: profile.get(name, value) for name, value in defaults.items()}
+    missing = [field for field in PROFILE_FIELDS if not is_number(profile.get(field))]
+    if missing:
+        raise ValueError(f'Profile {index} needs numeric {", ".join(missing)}.')
+    if any(profile[field] < 0 for field in PROFILE_FIELDS):
+        raise ValueError(f'Profile {index} has a negative rating.')
+    if not is_whole_number(job['iterations']) or not 1 <= job['iterations'] <= MAX_ITERATIONS:
+        raise ValueError(f'Profile {index}: iterations must be a whole number from 1 to {MAX_ITERATIONS}.')
+    if job['seed'] is not None and (not is_whole_number(job['seed']) or job['seed'] < 0):
+        raise ValueError(f'Profile {index}: seed must be a non-negative whole number or null.')
+    if not is_whole_number(job['mob_hp']) or not 1 <= job['mob_hp'] <= MAX_MOB_HP:
+        raise ValueError(f'Profile {index}: mob_hp must be a whole number from 1 to {MAX_MOB_HP}.')
+    if job['precision'] is not None and not (is_number(job['precision']) and 0 < job['precision'] < 1):
+        raise ValueError(f'Profile {index}: precision must be between 0 and 1, or null.')
+    if job['mode'] not in MODES:
+        raise ValueError(f'Profile {index}: mode must be one of {", ".join(MODES)}.')
+    job['index'] = index
+    job['id'] = profile.get('id')
+    job['profile'] = [profile[field] for field in PROFILE_FIELDS]
+    return job
+
+
+def job_result(job, error=None):
+    """The fields every result line of job starts with, and error if one is given."""
+    result = {'index': job['index'], 'id': job['id'], 'profile': dict(zip(PROFILE_FIELDS, job['profile'])),
+              'seed': job['seed']}
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+def simulate_job(job):
+    """Runs one job from parse_jobs and returns its result line as a dict. This runs in a worker process."""
+    result = job_result(job)
+    try:
+        # With a precision target, iterations is the batch size and MAX_ITERATIONS the most runs made.
+        summary = run_batch(job['profile'], job['iterations'], job['mob_hp'], job['seed'], mode=job['mode'],
+                            precision=job['precision'], max_iterations=MAX_ITERATIONS)
+    except ValueError as error:
+        result['error'] = str(error)
+    else:
+        result['summary'] = summary.as_dict()
+    return result
+
+
+def trace_job(job):
+    """Replays the first run of a job's batch and returns its hits as (time, spell, damage, crit) tuples under "hits".
+
+    The hits are those of run 0 of simulate_job's batch with the same seed. This runs in a worker process."""
+    result = {'index': job['index'], 'id': job['id']}
+    stats = Stats(*job['profile'])
+    try:
+        times, spell_ids, damage, crits = cached_schedule(stats, job['mob_hp']).sample_run(stats, job['mob_hp'],
+                                                                                           job['seed'])
+    except ValueError as error:
+        result['error'] = str(error)
+    else:
+        result['hits'] = [(time, SPELL_NAMES[spell_id], damage, crit) for time, spell_id, damage, crit
+                          in zip(times.tolist(), spell_ids.tolist(), damage.astype(int).tolist(), crits.tolist())]
+    return result
+
+
+def stream_results(pool, jobs):
+    """Submits every job to pool and yields one NDJSON line per job, in the order they finish.
+
+    Lines carry the index of their profile in the request, since they come back out of order. A job that fails in
+    any way gets an error line rather than ending the stream, and a pool whose workers died is discarded. Jobs that
+    have not started are cancelled if the client goes away before the last line."""
+    pending = {}
+    refused = []
+    for job in jobs:
+        try:
+            pending[pool.submit(simulate_job, job)] = job
+        except BrokenProcessPool:
+            refused.append(job)
+    if refused:
+        discard_pool(pool)
+    try:
+        for job in refused:
+            yield json.dumps(job_result(job, 'The worker pool was restarting. Please try again.')) + '\n'
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    discard_pool(pool)
+                    result = job_result(job, 'A worker process died while simulating this profile.')
+                except Exception as error:
+                    result = job_result(job, f'The simulation failed: {error}')
+                yield json.dumps(result) + '\n'
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry and counts hits and misses."""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        return {'size': len(self.data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class TTLCache(LRUCache):
+    """An LRUCache whose entries also expire ttl seconds after they are stored."""
+    def __init__(self, maxsize=128, ttl=600, clock=time.monotonic):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.clock = clock
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        super().put(key, (self.clock() + self.ttl, value))
@@ -1,10 +1,25 @@
-import random
-from flask import Blueprint
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import parent_process
+from flask import Blueprint, Response, jsonify, request
 import plotly.graph_objects as go
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+from aggregation import auto_bin_size, bin_hits, hits_in_window
+from apl import DEFAULT_APL
+from bulk import parse_jobs, stream_results, worker_pool
+from cache import TTLCache
+from engine import PROFILE_FIELDS, SPELL_NAMES, Stats
+from executor import SimulationExecutor, SimulationTimeout, Superseded
+from hitlog import HitLog
+from instrumentation import metrics
+from montecarlo import run_batch
+from resultstore import result_store
+from schedule import cached_schedule
+from sweep import SWEEP_STATS, SWEEP_STORE_PATH, Sweep, SweepStore, sweep_values
 
 
 wowsim_bp = Blueprint('wowsim_bp', __name__,
@@ -13,382 +28,43 @@ wowsim_bp = Blueprint('wowsim_bp', __name__,
                       static_url_path='/wowsim/static')
 
 
-def figure_maker(fig_name, log_name, bar_color):
-    """Creates plotly figure dictionaries"""
-    return {'type': 'bar',
-            'name': fig_name,
-            'x': log_name.time_list,
-            'y': log_name.damage_list,
-            'width': .4,
-            'marker': {'line': {'width': 1}, 'color': bar_color}}
-
-
-def make_dash(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating):
-    """Creates a new simulation timeline, figure, and DPS from the given stats."""
-    class Spells:
-        """Creates stats for direct damage spells"""
-
-        def __init__(self, sp_weight, sp_bias, cast_time, cooldown):
-            self.spell_damage = sp_weight * intellect + sp_bias
-            self.cast_time = cast_time / (1 + haste_percent)
-            self.cooldown = cooldown
-
-    class Dots:
-        """Creates stats for damage-over-time spells"""
-
-        def __init__(self, sp_weight, sp_bias, dot_duration, hit_interval, cast_time, cooldown):
-            self.dot_hit_damage = (sp_weight * intellect + sp_bias) / (dot_duration / hit_interval)
-            self.dot_hit_interval = hit_interval / (1 + haste_percent)
-            self.dot_duration = dot_duration
-            self.cast_time = cast_time / (1 + haste_percent)
-            self.cooldown = cooldown
-            self.last_hit_coeff = 0
-
-    class Channeled:
-        """Creates stats for channeled spells"""
-
-        def __init__(self, sp_weight, sp_bias, hits, channel_duration, cooldown):
-            self.hit_damage = (sp_weight * intellect + sp_bias) / hits
-            self.hit_interval = (channel_duration / (1 + haste_percent)) / hits
-            self.cooldown = cooldown
-            self.hit_count = 1
-
-    class Star:
-        """Creates stats for Divine Star"""
-
-        def __init__(self, sp_weight, sp_bias, cooldown):
-            self.hit_damage = (sp_weight * intellect + sp_bias) / 2
-            self.cooldown = cooldown
-            self.hit_count = 1
-
-    class Log:
-        """This is for logging data that will be passed to the timeline graph."""
-
-        def __init__(self):
-            self.time_list = []
-            self.damage_list = []
-
-        def update(self, time, damage):
-            self.time_list.append(time)
-            self.damage_list.append(damage)
-
-    class Logs:
-        """A class to hold all the logs."""
-
-        def __init__(self):
-            self.schism_log = Log()
-            self.pain_log = Log()
-            self.smite_log = Log()
-            self.solace_log = Log()
-            self.penance_log = Log()
-            self.divine_star_log = Log()
-
-    class Timeline:
-        """A timeline class which will keep track of the possible events that can occur"""
-        now = 0
-        gcd_end = float('inf')
-        schism_hit = float('inf')
-        schism_off_cd = 0
-        # Schism Debuff increases damage taken by 40% for 9 seconds.
-        schism_debuff_end = 0
-        pain_dd_hit = float('inf')
-        pain_dot_hit = float('inf')
-        pain_dot_end = 0
-        pain_dot_last_hit = float('inf')
-        smite_hit = float('inf')
-        penance_hit = float('inf')
-        penance_off_cd = 0
-        solace_hit = float('inf')
-        solace_off_cd = 0
-        divine_star_hit = float('inf')
-        divine_star_off_cd = 0
-
-    def schism_attack(fmob_hp, ftimeline, flog):
-        """Adjusts timeline and hitpoints after a Schism attack."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(schism.spell_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-        if crit_boolean:
-            # print(f'Schism crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.schism_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'Schism hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.schism_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        ftimeline.schism_hit = float('inf')
-        ftimeline.schism_off_cd = ftimeline.now + schism.cooldown
-        ftimeline.schism_debuff_end = ftimeline.now + 9
-        ftimeline = next_spell(ftimeline)
-        return fmob_hp, ftimeline, flog
-
-    def pain_dd_attack(fmob_hp, ftimeline, flog):
-        """Adjusts timeline and hitpoints after the direct damage portion of SW: Pain."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(pain_dd.spell_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-        if crit_boolean:
-            # print(f'SW: Pain DD crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.pain_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'SW: Pain DD hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.pain_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        ftimeline.pain_dd_hit = float('inf')
-        ftimeline.pain_dot_end = ftimeline.now + pain_dot.dot_duration
-        ftimeline.pain_dot_hit = ftimeline.now + pain_dot.dot_hit_interval
-        ftimeline.gcd_end = ftimeline.now + global_cd.cast_time
-        return fmob_hp, ftimeline, flog
-
-    def pain_dot_attack(fmob_hp, ftimeline, fpain_dot, flog):
-        """Adjusts timeline and hitpoints after a SW: Pain DoT hit."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(pain_dd.spell_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-        if crit_boolean:
-            # print(f'SW: Pain DoT crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.pain_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'SW: Pain DoT hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.pain_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        # This sets when the next dot hit will occur.
-        if ftimeline.now + fpain_dot.dot_hit_interval <= ftimeline.pain_dot_end:
-            ftimeline.pain_dot_hit = ftimeline.now + fpain_dot.dot_hit_interval
-        else:
-            fpain_dot.last_hit_coeff = (ftimeline.pain_dot_end - ftimeline.now) / fpain_dot.dot_hit_interval
-            ftimeline.pain_dot_last_hit = ftimeline.pain_dot_end
-            ftimeline.pain_dot_hit = float('inf')
-        return fmob_hp, ftimeline, fpain_dot, flog
-
-    def pain_last_dot_attack(fmob_hp, ftimeline, fpain_dot, flog):
-        """Adjusts timeline and hitpoints after a SW: Pain DoT hit."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(
-            pain_dd.spell_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4) * fpain_dot.last_hit_coeff)
-        if crit_boolean:
-            # print(f'SW: Pain DoT crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.pain_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'SW: Pain DoT hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.pain_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        ftimeline.pain_dot_end = 0
-        ftimeline.pain_dot_last_hit = float('inf')
-        return fmob_hp, ftimeline, flog
-
-    def penance_attack(fmob_hp, ftimeline, fpenance, flog):
-        """Adjusts timeline and hitpoints after a Penance attack."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(fpenance.hit_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-        if crit_boolean:
-            # print(f'Penance crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.penance_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'Penance hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.penance_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        if fpenance.hit_count == 1:
-            ftimeline.penance_off_cd = ftimeline.now + fpenance.cooldown
-        if fpenance.hit_count < 3:
-            ftimeline.penance_hit = ftimeline.now + fpenance.hit_interval
-        else:
-            ftimeline.penance_hit = float('inf')
-            ftimeline = next_spell(ftimeline)
-            fpenance.hit_count = 0
-        fpenance.hit_count += 1
-        return fmob_hp, ftimeline, fpenance, flog
-
-    def solace_attack(fmob_hp, ftimeline, flog):
-        """Adjusts timeline and hitpoints after a Solace attack."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(solace.spell_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-        if crit_boolean:
-            # print(f'Solace crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.solace_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'Solace hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.solace_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        ftimeline.solace_hit = float('inf')
-        ftimeline.solace_off_cd = ftimeline.now + solace.cooldown
-        ftimeline.gcd_end = ftimeline.now + global_cd.cast_time
-        return fmob_hp, ftimeline, flog
-
-    def divine_star_attack(fmob_hp, ftimeline, fdivine_star, flog):
-        """Adjusts timeline and hitpoints after a Divine Star attack."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(fdivine_star.hit_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-        if crit_boolean:
-            # print(f'Divine Star crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.divine_star_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'Divine Star hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.divine_star_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        if fdivine_star.hit_count == 1:
-            ftimeline.divine_star_off_cd = ftimeline.now + fdivine_star.cooldown
-            ftimeline.gcd_end = ftimeline.now + global_cd.cooldown
-            # This is fairly arbitrary. Divine Star goes some distance and then turns around and hits everything again on
-            # the way back. I'll just estimate that the first hit is instantaneous and the second occurs 1.5 seconds later.
-            # Haste seems to have no effect on this spell.
-            ftimeline.divine_star_hit = ftimeline.now + 1.5
-        else:
-            ftimeline.divine_star_hit = float('inf')
-            fdivine_star.hit_count = 0
-        fdivine_star.hit_count += 1
-        return fmob_hp, ftimeline, fdivine_star, flog
-
-    def smite_attack(fmob_hp, ftimeline, flog):
-        """Adjusts timeline and hitpoints after a Schism attack."""
-        crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-        if ftimeline.now <= ftimeline.schism_debuff_end:
-            schism_buff = True
-        else:
-            schism_buff = False
-        damage = int(smite.spell_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-        if crit_boolean:
-            # print(f'Smite crit for {damage * 2} at {ftimeline.now:.2f}s.')
-            flog.smite_log.update(ftimeline.now, damage * 2)
-            fmob_hp -= damage * 2
-            # print(f'Mob HP: {fmob_hp}.')
-        else:
-            # print(f'Smite hit for {damage} at {ftimeline.now:.2f}s.')
-            flog.smite_log.update(ftimeline.now, damage)
-            fmob_hp -= damage
-            # print(f'Mob HP: {fmob_hp}.')
-        ftimeline.smite_hit = float('inf')
-        ftimeline = next_spell(ftimeline)
-        return fmob_hp, ftimeline, flog
-
-    def next_time_stop():
-        """Determines next value for timeline.now"""
-        events_list = [timeline.schism_hit, timeline.pain_dd_hit, timeline.gcd_end, timeline.smite_hit,
-                       timeline.pain_dot_hit, timeline.pain_dot_last_hit, timeline.penance_hit, timeline.solace_hit,
-                       timeline.divine_star_hit]
-        return min(events_list)
-
-    def next_spell(ftimeline):
-        """After certain spells are cast or the GCD expires, this determines which spell should be cast next."""
-        if ftimeline.now >= ftimeline.schism_off_cd:
-            ftimeline.schism_hit = ftimeline.now + schism.cast_time
-        elif ftimeline.now >= ftimeline.pain_dot_end:
-            ftimeline.pain_dd_hit = ftimeline.now
-        elif ftimeline.now >= ftimeline.penance_off_cd:
-            ftimeline.penance_hit = ftimeline.now
-        elif ftimeline.now >= ftimeline.solace_off_cd:
-            ftimeline.solace_hit = ftimeline.now
-        elif ftimeline.now >= ftimeline.divine_star_off_cd:
-            ftimeline.divine_star_hit = ftimeline.now
-        else:
-            ftimeline.smite_hit = ftimeline.now + smite.cast_time
-        return ftimeline
-
-    def execute_time_stop(fmob_hp, ftimeline, fpain_dot, fpenance, fdivine_star, flog):
-        """Given a timestop, this determines which action should be taken."""
-        if ftimeline.now == ftimeline.pain_dot_hit:
-            fmob_hp, ftimeline, fpain_dot, flog = pain_dot_attack(fmob_hp, ftimeline, fpain_dot, flog)
-        elif ftimeline.now == ftimeline.pain_dot_last_hit:
-            fmob_hp, ftimeline, flog = pain_last_dot_attack(fmob_hp, ftimeline, fpain_dot, flog)
-        elif ftimeline.now == ftimeline.divine_star_hit:
-            fmob_hp, ftimeline, fdivine_star, flog = divine_star_attack(fmob_hp, ftimeline, fdivine_star, flog)
-        elif ftimeline.now == ftimeline.schism_hit:
-            fmob_hp, ftimeline, flog = schism_attack(fmob_hp, ftimeline, flog)
-        elif ftimeline.now == ftimeline.pain_dd_hit:
-            fmob_hp, ftimeline, flog = pain_dd_attack(fmob_hp, ftimeline, flog)
-        elif ftimeline.now == ftimeline.gcd_end:
-            ftimeline.gcd_end = float('inf')
-            ftimeline = next_spell(ftimeline)
-        elif ftimeline.now == ftimeline.smite_hit:
-            fmob_hp, ftimeline, flog = smite_attack(fmob_hp, ftimeline, flog)
-        elif ftimeline.now == ftimeline.penance_hit:
-            fmob_hp, ftimeline, fpenance, flog = penance_attack(fmob_hp, ftimeline, fpenance, flog)
-        elif ftimeline.now == ftimeline.solace_hit:
-            fmob_hp, ftimeline, flog = solace_attack(fmob_hp, ftimeline, flog)
-        return fmob_hp, ftimeline, fpain_dot, fpenance, fdivine_star, flog
-
-    def kill_one(ftimeline, fmob_num, fpain_dot, fpenance, fdivine_star, flog):
-        mob_hp = 500000
-        # print(f'Mob {fmob_num} HP: {mob_hp}.')
-        ftimeline = next_spell(ftimeline)
-        while mob_hp > 0:
-            ftimeline.now = next_time_stop()
-            mob_hp, ftimeline, fpain_dot, fpenance, fdivine_star, flog = execute_time_stop(mob_hp, ftimeline, fpain_dot,
-                                                                                           fpenance, fdivine_star, flog)
-        # print(f'Mob {fmob_num} died at {ftimeline.now:.2f}.')
-        return ftimeline, fmob_num, fpain_dot, fpenance, fdivine_star, flog
-
-    haste_percent = 0.04
-    crit_chance = crit_rating*0.1768/1273
-    haste_percent = haste_rating*0.0696/473
-    mastery_percent = mastery_rating*0.1343/716
-    versatility_percent = versatility_rating*0.0389/331
-
-    schism = Spells(1.29, 7.77, 1.5, 24)
-    global_cd = Spells(0, 0, 1.5, 0)
-    pain_dd = Spells(0.165, 0.858, 0, 0)
-    smite = Spells(0.57, 3.26, 1.5, 0)
-    solace = Spells(0.829, 5.11, 0, 12)
-    pain_dot = Dots(0.992, 1.31, 16, 2, 0, 0)
-    penance = Channeled(1.2, 0.726, 3, 2, 9)
-    divine_star = Star(0.8, 0, 15)
-    timeline = Timeline()
-    logs = Logs()
-    mob_number = 1
-
-    timeline, mob_number, pain_dot, penance, divine_star, logs = kill_one(timeline, mob_number, pain_dot, penance,
-                                                                          divine_star, logs)
-    collective_fig = {'data': [figure_maker('Schism', logs.schism_log, '#2F2F2F'),
-                               figure_maker('Solace', logs.solace_log, 'orange'),
-                               figure_maker('Smite', logs.smite_log, '#589B9B'),
-                               figure_maker('Penance', logs.penance_log, 'yellow'),
-                               figure_maker('Divine Star', logs.divine_star_log, 'white'),
-                               figure_maker('SW: Pain', logs.pain_log, '#797a7e')],
+# Finished figures and results keyed by the make_dash arguments. Popular stat profiles, and the default stats most of
+# all, are requested over and over.
+dash_cache = TTLCache(maxsize=256, ttl=600)
+metrics.register_cache('dash', dash_cache)
+if result_store is not None:
+    metrics.register_cache('results', result_store)
+
+
+# Fights with more hits than this are drawn as damage per time bin rather than one bar per hit.
+MAX_RAW_HITS = 600
+
+
+# The app runs batches until the mean DPS is within 0.2% at 95% confidence, in steps of 200 runs and never more than
+# DASH_MAX_ITERATIONS.
+DASH_PRECISION = 0.002
+DASH_MAX_ITERATIONS = 20000
+
+
+# Runs per sweep cell, and the most points a sweep may have along each axis.
+SWEEP_ITERATIONS = 500
+MAX_SWEEP_POINTS = 15
+
+
+# The timeline's traces: name, the spells drawn in it and bar color.
+TRACES = (('Schism', ('Schism',), '#2F2F2F'),
+          ('Solace', ('Solace',), 'orange'),
+          ('Smite', ('Smite',), '#589B9B'),
+          ('Penance', ('Penance',), 'yellow'),
+          ('Divine Star', ('Divine Star',), 'white'),
+          ('SW: Pain', ('SW: Pain DD', 'SW: Pain DoT'), '#797a7e'))
+
+
+def figure_template():
+    """The timeline figure without any hits: every layout setting and trace style, validated by plotly once."""
+    collective_fig = {'data': [{'type': 'bar', 'name': fig_name, 'x': [], 'y': [], 'width': .4,
+                                'marker': {'line': {'width': 1}, 'color': bar_color}}
+                               for fig_name, spell_names, bar_color in TRACES],
                       'layout': {'showlegend': True, 'paper_bgcolor': '#3d3d3d', 'plot_bgcolor': '#D6CCB4',
                                  'legend': {'font': {'family': 'Shadows Into Light', 'color': '#D8E7EF', 'size': 24},
                                             'orientation': 'v'}}}
@@ -399,18 +75,179 @@ def make_dash(intellect, crit_rating, haste_rating, mastery_rating, versatility_
                       title={'text': 'Timeline of Spell Hits', 'xref': 'paper', 'x': 0.5,
                              'font': {'family': 'Shadows Into Light', 'size': 34}})
     fig.update_traces(marker={'line': {'color': 'black', 'width': 0}})
-    results = ['Time to do 500k damage: ', html.Span(className='time_taken', children=f'{timeline.now:.02f}'),
-               ' seconds',
-               html.Br(),
-               'Average DPS: ', html.Span(className='time_taken', children=f'{500000/timeline.now:,.02f}')]
+    return fig.to_plotly_json()
+
 
-    return fig, results
+def figure_maker(log, spell_names, bin_size=None):
+    """The x, y and bar width of a trace from the hits of spell_names in a HitLog, binned if bin_size is given.
 
+    Times are rounded to milliseconds, as finer digits only add bytes to every update."""
+    if bin_size:
+        times, damages = bin_hits(log, spell_names, bin_size)
+        return {'x': times, 'y': damages.round(1), 'width': bin_size*.8}
+    times, damages = log.for_spells(*spell_names)
+    return {'x': times.round(3), 'y': damages, 'width': .4}
 
-def initial_layout(intel, crit, haste, mastery, versatility):
-    fig, results = make_dash(intel, crit, haste, mastery, versatility)
+
+def fill_figure(template, figure_data):
+    """The template figure with the traces and titles of a make_dash result, as the clientside callback builds it."""
+    layout = dict(template['layout'], uirevision=figure_data['uirevision'],
+                  title=dict(template['layout']['title'], text=figure_data['title']))
+    layout['yaxis'] = dict(layout['yaxis'], title=dict(layout['yaxis']['title'], text=figure_data['y_title']))
+    return {'data': [dict(trace, **changes) for trace, changes in zip(template['data'], figure_data['traces'])],
+            'layout': layout}
+
+
+def sweep_template():
+    """The sweep heatmap without any cells, styled like the timeline."""
+    fig = go.Figure(go.Heatmap(x=[], y=[], z=[], colorscale='Viridis', hoverongaps=False,
+                               colorbar={'title': {'text': 'DPS'}}))
+    fig.update_layout(paper_bgcolor='#3d3d3d', plot_bgcolor='#D6CCB4', font_color='#D6CCB4',
+                      xaxis={'title': {'font': {'family': 'Shadows Into Light', 'size': 24}}},
+                      yaxis={'title': {'font': {'family': 'Shadows Into Light', 'size': 24}}},
+                      title={'text': 'Mean DPS by Stats', 'xref': 'paper', 'x': 0.5,
+                             'font': {'family': 'Shadows Into Light', 'size': 34}})
+    return fig.to_plotly_json()
+
+
+def fill_sweep(template, sweep):
+    """The sweep template with the axes of a Sweep and the cells it has finished so far."""
+    layout = dict(template['layout'])
+    for axis, stat in (('xaxis', sweep.x_stat), ('yaxis', sweep.y_stat)):
+        layout[axis] = dict(layout[axis], title=dict(layout[axis]['title'], text=SWEEP_STATS[stat]))
+    return {'data': [dict(template['data'][0], x=sweep.x_values, y=sweep.y_values, z=sweep.z())], 'layout': layout}
+
+
+def sweep_status(sweep):
+    """How far a sweep has got, and its best cell once it is done."""
+    if not sweep.done:
+        return f'Sweep: {sweep.finished_cells} of {sweep.dps.size} cells done'
+    best = sweep.best()
+    if best is None:
+        return 'None of the sweep could be simulated.'
+    x_value, y_value, dps = best
+    return [f'Best: {SWEEP_STATS[sweep.x_stat]} {x_value}, {SWEEP_STATS[sweep.y_stat]} {y_value} at ',
+            html.Span(className='time_taken', children=f'{dps:,.02f}'), ' DPS']
+
+
+# Copies the traces and titles sent by update_dash into the figure already on the page. The layout and trace styles
+# never change, so they are not sent or validated again.
+FILL_FIGURE_JS = """
+function(figureData, figure) {
+    if (!figureData) {
+        return window.dash_clientside.no_update;
+    }
+    const layout = Object.assign({}, figure.layout, {
+        uirevision: figureData.uirevision,
+        title: Object.assign({}, figure.layout.title, {text: figureData.title}),
+        yaxis: Object.assign({}, figure.layout.yaxis, {
+            title: Object.assign({}, figure.layout.yaxis.title, {text: figureData.y_title})
+        })
+    });
+    return {data: figure.data.map((trace, i) => Object.assign({}, trace, figureData.traces[i])), layout: layout};
+}
+"""
+
+
+def dash_key(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating, iterations=200, seed=0,
+             precision=None, bin_size='auto', window=None):
+    """The dash_cache key of a make_dash call."""
+    return (intellect, crit_rating, haste_rating, mastery_rating, versatility_rating, iterations, seed, precision,
+            bin_size, window)
+
+
+def zoom_window(relayout_data):
+    """The (start, end) x range of a graph's relayoutData, None when it was reset, or PreventUpdate otherwise."""
+    if relayout_data and 'xaxis.range[0]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if relayout_data and relayout_data.get('xaxis.autorange'):
+        return None
+    raise PreventUpdate
+
+
+def simulate_dash(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating, iterations=200, seed=0,
+                  precision=None):
+    """Runs the simulations behind make_dash. Only plain data is returned, so this can run in a worker process."""
+    stats = Stats(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating)
+    # The cast schedule only depends on haste, so changing any other stat reuses the cached one.
+    hits = cached_schedule(stats, 500000).sample_run(stats, 500000, seed)
+    summary = run_batch(stats, iterations, 500000, seed, precision=precision, max_iterations=DASH_MAX_ITERATIONS)
+    expected = run_batch(stats, mob_hp=500000, expected_only=True)
+    # Executor workers send back what they counted, for make_dash to merge into the metrics the app serves.
+    counted = metrics.drain() if metrics.enabled and parent_process() is not None else None
+    return hits, summary, expected, counted
+
+
+def make_dash(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating, iterations=200, seed=0,
+              precision=None, bin_size='auto', window=None, simulation=None):
+    """Creates a new simulation timeline, figure data, and DPS from the given stats.
+
+    The figure data holds what changes between stats: each trace's x, y and bar width in TRACES order, the titles,
+    the uirevision and whether the whole fight is drawn binned, which is when zooming drills down. fill_figure, or the
+    clientside callback, puts it into the figure_template.
+
+    The timeline shows a single run. The mean DPS and its confidence interval come from a batch of iterations runs.
+    Both are drawn from seed, so the same inputs always give the same answer and results are served from
+    dash_cache while they are fresh. simulation takes the output of simulate_dash when it was run elsewhere, by a
+    caller that has already looked the arguments up in dash_cache. With a precision target, such as 0.002 for a mean
+    DPS within 0.2%, the batch runs iterations runs at a time until its confidence interval is that tight, up to
+    DASH_MAX_ITERATIONS runs.
+
+    With bin_size 'auto', fights of more than MAX_RAW_HITS hits are drawn as DPS per time bin, sized from the fight
+    length; a number always bins and None never does. window, a (start, end) pair of seconds, drills into a binned
+    timeline and draws the raw hits in that range instead."""
+    key = dash_key(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating, iterations, seed,
+                   precision, bin_size, window)
+    if simulation is None:
+        cached = dash_cache.get(key)
+        if cached is not None:
+            return cached
+        simulation = simulate_dash(*key[:8])
+    hits, summary, expected, counted = simulation
+    metrics.merge(counted)
+
+    with metrics.time('wowsim_figure_seconds'):
+        log = HitLog(SPELL_NAMES, capacity=len(hits[0]))
+        log.extend(*hits)
+        kill_time = log.times[-1]
+        if bin_size == 'auto':
+            bin_size = auto_bin_size(kill_time) if len(log) > MAX_RAW_HITS else None
+        binned = bool(bin_size)
+        if bin_size and window is not None:
+            log = hits_in_window(log, *window)
+            bin_size = None
+        if bin_size:
+            title, y_title = f'Damage per Second in {bin_size}s Bins', 'DPS'
+        else:
+            title, y_title = 'Timeline of Spell Hits', 'Damage'
+        figure_data = {'traces': [figure_maker(log, spell_names, bin_size)
+                                  for fig_name, spell_names, bar_color in TRACES],
+                       'title': title,
+                       'y_title': y_title,
+                       # Keeps the user's zoom when a drill-down replaces the hits for the same stats.
+                       'uirevision': str(key[:8]),
+                       'binned': binned}
+        results = ['Time to do 500k damage: ', html.Span(className='time_taken', children=f'{kill_time:.02f}'),
+                   ' seconds',
+                   html.Br(),
+                   'Average DPS: ', html.Span(className='time_taken', children=f'{500000/kill_time:,.02f}'),
+                   html.Br(),
+                   f'Mean DPS over {summary.iterations:,} runs: ',
+                   html.Span(className='time_taken', children=f'{summary.dps.mean:,.02f}'),
+                   f' ({summary.confidence:.0%} CI {summary.dps.ci[0]:,.02f} to {summary.dps.ci[1]:,.02f})',
+                   html.Br(),
+                   'Expected DPS: ', html.Span(className='time_taken', children=f'{expected.dps.mean:,.02f}')]
+
+    dash_cache.put(key, (figure_data, results))
+    return figure_data, results
+
+
+def initial_layout(template, sweep_figure, intel, crit, haste, mastery, versatility):
+    figure_data, results = make_dash(intel, crit, haste, mastery, versatility, precision=DASH_PRECISION)
     return html.Div(children=[html.H1(className='head',
                                       children='Disc Priest Damage Simulator'),
+                              # Each page load gets its own id so that only its latest request is simulated.
+                              dcc.Store(id='session-id', data=str(uuid.uuid4())),
                               html.Div(className='settings',
                                        id='settings',
                                        children=['Intellect: ', dcc.Input(className='inputs', id='intellect',
@@ -430,20 +267,52 @@ def initial_layout(intel, crit, haste, mastery, versatility):
                               html.Div(className='results',
                                        id='results',
                                        children=results),
-                              dcc.Graph(id='example-graph', figure=fig),
+                              # update_dash only sends new traces and titles, which are filled into the figure
+                              # in the browser.
+                              dcc.Store(id='figure-data', data=figure_data),
+                              dcc.Graph(id='example-graph', figure=fill_figure(template, figure_data)),
+                              html.Div(className='settings',
+                                       id='sweep-settings',
+                                       children=['Sweep ', dcc.Dropdown(className='dropdowns', id='sweep-x',
+                                                                        options=[{'label': label, 'value': stat}
+                                                                                 for stat, label
+                                                                                 in SWEEP_STATS.items()],
+                                                                        value='haste_rating', clearable=False),
+                                                 ' against ', dcc.Dropdown(className='dropdowns', id='sweep-y',
+                                                                           options=[{'label': label, 'value': stat}
+                                                                                    for stat, label
+                                                                                    in SWEEP_STATS.items()],
+                                                                           value='crit_rating', clearable=False),
+                                                 ' Step: ', dcc.Input(className='inputs', id='sweep-step', value=100,
+                                                                      type='number', min=1),
+                                                 ' Points: ', dcc.Input(className='inputs', id='sweep-points',
+                                                                        value=7, type='number', min=2,
+                                                                        max=MAX_SWEEP_POINTS),
+                                                 ' ', html.Button('Run Sweep', className='buttons',
+                                                                  id='sweep-button', n_clicks=0)]),
+                              html.Div(className='results',
+                                       id='sweep-status'),
+                              # The sweep grid centers on the stats above. While it runs, the interval polls for
+                              # finished cells and the heatmap fills in as they arrive. sweep-seen holds how many
+                              # lines the heatmap on the page has.
+                              dcc.Graph(id='sweep-graph', figure=sweep_figure),
+                              dcc.Interval(id='sweep-interval', interval=500, disabled=True),
+                              dcc.Store(id='sweep-seen', data=0),
                               html.Div(className='about',
                                        children=[html.H1('About'),
                                                  'This app will simulate combat undertaken by a level 120 discipline '
                                                  'priest in the Battle for Azeroth expansion of World of Warcraft. It '
                                                  'assists a player in deciding how to gear and distribute their stats '
                                                  'for maximum effect. Spells are prioritized in the following order: '
-                                                 'Schism, SW: Pain, Penance, Solace, Divine Star, Smite. SW: Pain is '
+                                                 f'{DEFAULT_APL.describe()}. SW: Pain is '
                                                  'only cast when it is no longer in effect. The rest are cast when off '
                                                  'cooldown and according to their priority. This app does not account '
                                                  'for many talent choices. Note that there is randomness in critical '
-                                                 'hits. Thus, multiple runs with identical stats will likely render '
-                                                 'different results. Also note that this app does not simulate the '
-                                                 'effects of Azerite traits, Corruptions, and a host of trinkets. As '
+                                                 'hits. The graph shows a single run, so the mean DPS of many runs is '
+                                                 'shown alongside it. Random numbers are drawn from a fixed seed, so '
+                                                 'identical stats always render identical results. Also note that '
+                                                 'this app does not simulate the effects of Azerite traits, '
+                                                 'Corruptions, and a host of trinkets. As '
                                                  'the variety and magnitudes of such effects are expansive and the end '
                                                  'of this expansion is imminent, I have no plans of going to the '
                                                  'effort of adding them.',
@@ -463,26 +332,129 @@ def initial_layout(intel, crit, haste, mastery, versatility):
                     )
 
 
+@wowsim_bp.route('/wowsim/metrics', methods=['GET'])
+def sim_metrics():
+    """Serves the simulator's counters and timers to Prometheus. Set WOWSIM_METRICS=1 to collect them."""
+    return Response(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+
+@wowsim_bp.route('/wowsim/api/simulate', methods=['POST'])
+def bulk_simulate():
+    """Simulates a batch of stat profiles across the bulk worker pool and streams back one NDJSON summary line per
+    profile as each one finishes. The request body is described in bulk.parse_jobs."""
+    try:
+        jobs = parse_jobs(request.get_json(silent=True))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    return Response(stream_results(worker_pool(), jobs), mimetype='application/x-ndjson')
+
+
 @wowsim_bp.route('/wowsim', methods=['GET'])
 def create_sim_dash(server):
     """Creates the Wow Sim App dashboard and determines its initial layout."""
     sim_app = dash.Dash(__name__, server=server, routes_pathname_prefix='/wowsim/')
     sim_app.title = 'BFA Disc Priest Sim'
-    sim_app.layout = initial_layout(7000, 1000, 1000, 500, 500)
-
-    init_callbacks(sim_app)
-
+    # A function rather than a fixed layout, so that every page load gets a new session id.
+    template = figure_template()
+    sweep_figure = sweep_template()
+    sim_app.layout = lambda: initial_layout(template, sweep_figure, 7000, 1000, 1000, 500, 500)
+
+    init_callbacks(sim_app, sweep_figure)
+
+
+def init_callbacks(sim_app, sweep_figure):
+    executor = SimulationExecutor(workers=2, timeout=10)
+    # Sweeps get their own pool, so a running sweep never holds up the timeline. Their progress is kept in the sweep
+    # store, so a poll can reach any app process.
+    sweep_pool = ProcessPoolExecutor(max_workers=2)
+    sweep_store = SweepStore(SWEEP_STORE_PATH)
+
+    sim_app.clientside_callback(
+        FILL_FIGURE_JS,
+        Output(component_id='example-graph', component_property='figure'),
+        [Input(component_id='figure-data', component_property='data')],
+        [State(component_id='example-graph', component_property='figure')]
+    )
 
-def init_callbacks(sim_app):
     @sim_app.callback(
-        [Output(component_id='example-graph', component_property='figure'),
+        [Output(component_id='figure-data', component_property='data'),
          Output(component_id='results', component_property='children')],
         [Input(component_id='intellect', component_property='value'),
          Input(component_id='crit', component_property='value'),
          Input(component_id='haste', component_property='value'),
          Input(component_id='mastery', component_property='value'),
-         Input(component_id='versatility', component_property='value')]
+         Input(component_id='versatility', component_property='value'),
+         Input(component_id='example-graph', component_property='relayoutData')],
+        [State(component_id='session-id', component_property='data'),
+         State(component_id='figure-data', component_property='data')]
+    )
+    def update_dash(intel, crit, haste, mastery, versatility, relayout_data, session_id, figure_data):
+        window = None
+        if any(trigger['prop_id'] == 'example-graph.relayoutData' for trigger in dash.callback_context.triggered):
+            # Zooming into a binned timeline drills down to the raw hits of the visible range. Raw hits are all on
+            # the page already, so zooming into them needs nothing new.
+            if not figure_data or not figure_data.get('binned'):
+                raise PreventUpdate
+            window = zoom_window(relayout_data)
+        cached = dash_cache.get(dash_key(intel, crit, haste, mastery, versatility, precision=DASH_PRECISION,
+                                         window=window))
+        if cached is not None:
+            return cached
+        # Simulations run off the request thread. If this session has already sent newer inputs, this request's
+        # result would be thrown away anyway, so the update is skipped.
+        try:
+            with metrics.time('wowsim_simulation_seconds'):
+                simulation = executor.run(session_id, simulate_dash, intel, crit, haste, mastery, versatility, 200, 0,
+                                          DASH_PRECISION)
+        except Superseded:
+            raise PreventUpdate
+        except SimulationTimeout:
+            return dash.no_update, ['The simulation took too long. Please try again.']
+        figure_data, now = make_dash(intel, crit, haste, mastery, versatility, precision=DASH_PRECISION, window=window,
+                                     simulation=simulation)
+        return figure_data, now
+
+    @sim_app.callback(
+        [Output(component_id='sweep-graph', component_property='figure'),
+         Output(component_id='sweep-interval', component_property='disabled'),
+         Output(component_id='sweep-status', component_property='children'),
+         Output(component_id='sweep-seen', component_property='data')],
+        [Input(component_id='sweep-button', component_property='n_clicks'),
+         Input(component_id='sweep-interval', component_property='n_intervals')],
+        [State(component_id='intellect', component_property='value'),
+         State(component_id='crit', component_property='value'),
+         State(component_id='haste', component_property='value'),
+         State(component_id='mastery', component_property='value'),
+         State(component_id='versatility', component_property='value'),
+         State(component_id='sweep-x', component_property='value'),
+         State(component_id='sweep-y', component_property='value'),
+         State(component_id='sweep-step', component_property='value'),
+         State(component_id='sweep-points', component_property='value'),
+         State(component_id='session-id', component_property='data'),
+         State(component_id='sweep-seen', component_property='data')]
     )
-    def update_dash(intel, crit, haste, mastery, versatility):
-        fig, now = make_dash(intel, crit, haste, mastery, versatility)
-        return fig, now
+    def update_sweep(n_clicks, n_intervals, intel, crit, haste, mastery, versatility, x_stat, y_stat, step, points,
+                     session_id, seen):
+        if any(trigger['prop_id'] == 'sweep-button.n_clicks' for trigger in dash.callback_context.triggered):
+            if not n_clicks:
+                raise PreventUpdate
+            if not step or step < 1 or not points or not 2 <= points <= MAX_SWEEP_POINTS:
+                message = f'Pick a step of at least 1 and 2 to {MAX_SWEEP_POINTS} points.'
+                return dash.no_update, True, [message], dash.no_update
+            profile = (intel, crit, haste, mastery, versatility)
+            center = dict(zip(PROFILE_FIELDS, profile))
+            try:
+                sweep = Sweep(x_stat, sweep_values(center[x_stat], step, points), y_stat,
+                              sweep_values(center[y_stat], step, points))
+            except ValueError as error:
+                return dash.no_update, True, [str(error)], dash.no_update
+            # A new sweep replaces the session's last one, whose remaining lines are cancelled.
+            sweep_store.start(session_id, sweep, sweep_pool, profile, SWEEP_ITERATIONS)
+        else:
+            sweep = sweep_store.load(session_id)
+            if sweep is None:
+                return dash.no_update, True, ['The sweep was lost. Please run it again.'], dash.no_update
+            if len(sweep.finished) == seen:
+                # Polls that find nothing new send no update.
+                raise PreventUpdate
+        return fill_sweep(sweep_figure, sweep), sweep.done, sweep_status(sweep), len(sweep.finished)
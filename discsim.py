@@ -1,348 +1,227 @@
-import random
-
-
-class Spells:
-    """Creates stats for direct damage spells"""
-    def __init__(self, sp_weight, sp_bias, cast_time, cooldown):
-        self.spell_damage = sp_weight*intellect + sp_bias
-        self.cast_time = cast_time/(1+haste_percent)
-        self.cooldown = cooldown
-
-
-class Dots:
-    """Creates stats for damage-over-time spells"""
-    def __init__(self, sp_weight, sp_bias, dot_duration, hit_interval, cast_time, cooldown):
-        self.dot_hit_damage = (sp_weight*intellect + sp_bias)/(dot_duration/hit_interval)
-        self.dot_hit_interval = hit_interval / (1+haste_percent)
-        self.dot_duration = dot_duration
-        self.cast_time = cast_time/(1+haste_percent)
-        self.cooldown = cooldown
-        self.last_hit_coeff = 0
-
-
-class Channeled:
-    """Creates stats for channeled spells"""
-    def __init__(self, sp_weight, sp_bias, hits, channel_duration, cooldown):
-        self.hit_damage = (sp_weight*intellect + sp_bias)/hits
-        self.hit_interval = (channel_duration / (1+haste_percent))/hits
-        self.cooldown = cooldown
-        self.hit_count = 1
-
-
-class Star:
-    """Creates stats for Divine Star"""
-    def __init__(self, sp_weight, sp_bias, cooldown):
-        self.hit_damage = (sp_weight*intellect + sp_bias)/2
-        self.cooldown = cooldown
-        self.hit_count = 1
-
-
-class Timeline:
-    """A timeline class which will keep track of the possible events that can occur"""
-    now = 0
-    gcd_end = float('inf')
-    schism_hit = float('inf')
-    schism_off_cd = 0
-    # Schism Debuff increases damage taken by 40% for 9 seconds.
-    schism_debuff_end = 0
-    pain_dd_hit = float('inf')
-    pain_dot_hit = float('inf')
-    pain_dot_end = 0
-    pain_dot_last_hit = float('inf')
-    smite_hit = float('inf')
-    penance_hit = float('inf')
-    penance_off_cd = 0
-    solace_hit = float('inf')
-    solace_off_cd = 0
-    divine_star_hit = float('inf')
-    divine_star_off_cd = 0
-
-
-def schism_attack(fmob_hp, ftimeline):
-    """Adjusts timeline and hitpoints after a Schism attack."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1-crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(schism.spell_damage*(1+versatility_percent)*(1+schism_buff*0.4))
-    if crit_boolean:
-        print(f'Schism crit for {damage*2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage*2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'Schism hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    ftimeline.schism_hit = float('inf')
-    ftimeline.schism_off_cd = ftimeline.now + schism.cooldown
-    ftimeline.schism_debuff_end = ftimeline.now + 9
-    ftimeline = next_spell(ftimeline)
-    return fmob_hp, ftimeline
-
-
-def pain_dd_attack(fmob_hp, ftimeline):
-    """Adjusts timeline and hitpoints after the direct damage portion of SW: Pain."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1-crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(pain_dd.spell_damage*(1+versatility_percent)*(1+schism_buff*0.4))
-    if crit_boolean:
-        print(f'SW: Pain DD crit for {damage*2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage*2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'SW: Pain DD hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    ftimeline.pain_dd_hit = float('inf')
-    ftimeline.pain_dot_end = ftimeline.now + pain_dot.dot_duration
-    ftimeline.pain_dot_hit = ftimeline.now + pain_dot.dot_hit_interval
-    ftimeline.gcd_end = ftimeline.now + global_cd.cast_time
-    return fmob_hp, ftimeline
-
-
-def pain_dot_attack(fmob_hp, ftimeline, fpain_dot):
-    """Adjusts timeline and hitpoints after a SW: Pain DoT hit."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1-crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(pain_dd.spell_damage*(1+versatility_percent)*(1+schism_buff*0.4))
-    if crit_boolean:
-        print(f'SW: Pain DoT crit for {damage*2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage*2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'SW: Pain DoT hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    # This sets when the next dot hit will occur.
-    if ftimeline.now + fpain_dot.dot_hit_interval <= ftimeline.pain_dot_end:
-        ftimeline.pain_dot_hit = ftimeline.now + fpain_dot.dot_hit_interval
-    else:
-        fpain_dot.last_hit_coeff = (ftimeline.pain_dot_end - ftimeline.now)/fpain_dot.dot_hit_interval
-        ftimeline.pain_dot_last_hit = ftimeline.pain_dot_end
-        ftimeline.pain_dot_hit = float('inf')
-    return fmob_hp, ftimeline, fpain_dot
-
-
-def pain_last_dot_attack(fmob_hp, ftimeline, fpain_dot):
-    """Adjusts timeline and hitpoints after a SW: Pain DoT hit."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1-crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(pain_dd.spell_damage*(1+versatility_percent)*(1+schism_buff*0.4)*fpain_dot.last_hit_coeff)
-    if crit_boolean:
-        print(f'SW: Pain DoT crit for {damage*2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage*2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'SW: Pain DoT hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    ftimeline.pain_dot_end = 0
-    ftimeline.pain_dot_last_hit = float('inf')
-    return fmob_hp, ftimeline
-
-
-def penance_attack(fmob_hp, ftimeline, fpenance):
-    """Adjusts timeline and hitpoints after a Penance attack."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1-crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(fpenance.hit_damage*(1+versatility_percent)*(1+schism_buff*0.4))
-    if crit_boolean:
-        print(f'Penance crit for {damage*2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage*2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'Penance hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    if fpenance.hit_count == 1:
-        ftimeline.penance_off_cd = ftimeline.now + fpenance.cooldown
-    if fpenance.hit_count < 3:
-        ftimeline.penance_hit = ftimeline.now + fpenance.hit_interval
-    else:
-        ftimeline.penance_hit = float('inf')
-        ftimeline = next_spell(ftimeline)
-        fpenance.hit_count = 0
-    fpenance.hit_count += 1
-    return fmob_hp, ftimeline, fpenance
-
-
-def solace_attack(fmob_hp, ftimeline):
-    """Adjusts timeline and hitpoints after a Solace attack."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1-crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(solace.spell_damage*(1+versatility_percent)*(1+schism_buff*0.4))
-    if crit_boolean:
-        print(f'Solace crit for {damage*2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage*2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'Solace hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    ftimeline.solace_hit = float('inf')
-    ftimeline.solace_off_cd = ftimeline.now + solace.cooldown
-    ftimeline.gcd_end = ftimeline.now + global_cd.cast_time
-    return fmob_hp, ftimeline
-
-
-def divine_star_attack(fmob_hp, ftimeline, fdivine_star):
-    """Adjusts timeline and hitpoints after a Divine Star attack."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1 - crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(fdivine_star.hit_damage * (1 + versatility_percent) * (1 + schism_buff * 0.4))
-    if crit_boolean:
-        print(f'Divine Star crit for {damage * 2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage * 2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'Divine Star hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    if fdivine_star.hit_count == 1:
-        ftimeline.divine_star_off_cd = ftimeline.now + fdivine_star.cooldown
-        ftimeline.gcd_end = ftimeline.now + global_cd.cooldown
-        # This is fairly arbitrary. Divine Star goes some distance and then turns around and hits everything again on
-        # the way back. I'll just estimate that the first hit is instantaneous and the second occurs 1.5 seconds later.
-        # Haste seems to have no effect on this spell.
-        ftimeline.divine_star_hit = ftimeline.now + 1.5
-    else:
-        ftimeline.divine_star_hit = float('inf')
-        fdivine_star.hit_count = 0
-    fdivine_star.hit_count += 1
-    return fmob_hp, ftimeline, fdivine_star
-
-
-def smite_attack(fmob_hp, ftimeline):
-    """Adjusts timeline and hitpoints after a Schism attack."""
-    crit_boolean = random.choices([True, False], weights=[crit_chance, 1-crit_chance])[0]
-    if ftimeline.now <= ftimeline.schism_debuff_end:
-        schism_buff = True
-    else:
-        schism_buff = False
-    damage = int(smite.spell_damage*(1+versatility_percent)*(1+schism_buff*0.4))
-    if crit_boolean:
-        print(f'Smite crit for {damage*2} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage*2
-        print(f'Mob HP: {fmob_hp}.')
-    else:
-        print(f'Smite hit for {damage} at {ftimeline.now:.2f}s.')
-        fmob_hp -= damage
-        print(f'Mob HP: {fmob_hp}.')
-    ftimeline.smite_hit = float('inf')
-    ftimeline = next_spell(ftimeline)
-    return fmob_hp, ftimeline
-
-
-def next_time_stop():
-    """Determines next value for timeline.now"""
-    # Values that default to zero can't be included in the list or they'll be the min value every time.
-    events_list = [timeline.schism_hit, timeline.pain_dd_hit, timeline.gcd_end, timeline.smite_hit,
-                   timeline.pain_dot_hit, timeline.pain_dot_last_hit, timeline.penance_hit, timeline.solace_hit,
-                   timeline.divine_star_hit]
-    return min(events_list)
-
-
-def next_spell(ftimeline):
-    """After certain spells are cast or the GCD expires, this determines which spell should be cast next."""
-    if ftimeline.now >= ftimeline.schism_off_cd:
-        ftimeline.schism_hit = ftimeline.now + schism.cast_time
-    elif ftimeline.now >= ftimeline.pain_dot_end:
-        ftimeline.pain_dd_hit = ftimeline.now
-    elif ftimeline.now >= ftimeline.penance_off_cd:
-        ftimeline.penance_hit = ftimeline.now
-    elif ftimeline.now >= ftimeline.solace_off_cd:
-        ftimeline.solace_hit = ftimeline.now
-    elif ftimeline.now >= ftimeline.divine_star_off_cd:
-        ftimeline.divine_star_hit = ftimeline.now
-    else:
-        ftimeline.smite_hit = ftimeline.now + smite.cast_time
-    return ftimeline
-
-
-def execute_time_stop(fmob_hp, ftimeline, fpain_dot, fpenance, fdivine_star):
-    """Given a timestop, this determines which action should be taken."""
-    if ftimeline.now == ftimeline.pain_dot_hit:
-        fmob_hp, ftimeline, fpain_dot = pain_dot_attack(fmob_hp, ftimeline, fpain_dot)
-    elif ftimeline.now == ftimeline.pain_dot_last_hit:
-        fmob_hp, ftimeline = pain_last_dot_attack(fmob_hp, ftimeline, fpain_dot)
-    elif ftimeline.now == ftimeline.divine_star_hit:
-        fmob_hp, ftimeline, fdivine_star = divine_star_attack(fmob_hp, ftimeline, fdivine_star)
-    elif ftimeline.now == ftimeline.schism_hit:
-        fmob_hp, ftimeline = schism_attack(fmob_hp, ftimeline)
-    elif ftimeline.now == ftimeline.pain_dd_hit:
-        fmob_hp, ftimeline = pain_dd_attack(fmob_hp, ftimeline)
-    elif ftimeline.now == ftimeline.gcd_end:
-        ftimeline.gcd_end = float('inf')
-        ftimeline = next_spell(ftimeline)
-    elif ftimeline.now == ftimeline.smite_hit:
-        fmob_hp, ftimeline = smite_attack(fmob_hp, ftimeline)
-    elif ftimeline.now == ftimeline.penance_hit:
-        fmob_hp, ftimeline, fpenance = penance_attack(fmob_hp, ftimeline, fpenance)
-    elif ftimeline.now == ftimeline.solace_hit:
-        fmob_hp, ftimeline = solace_attack(fmob_hp, ftimeline)
-    return fmob_hp, ftimeline, fpain_dot, fpenance, fdivine_star
-
-
-def kill_one(ftimeline, fmob_num, fpain_dot, fpenance, fdivine_star):
-    mob_hp = int(random.randrange(mob_min_hp, mob_max_hp+1))
-    print(f'Mob {fmob_num} HP: {mob_hp}.')
-    ftimeline = next_spell(ftimeline)
-    while mob_hp > 0:
-        ftimeline.now = next_time_stop()
-        mob_hp, ftimeline, fpain_dot, fpenance, fdivine_star = execute_time_stop(mob_hp, ftimeline, fpain_dot,
-                                                                                 fpenance, fdivine_star)
-    print(f'Mob {fmob_num} died at {ftimeline.now:.2f}.')
-    return ftimeline, fmob_num, fpain_dot, fpenance, fdivine_star
-
-
-intellect = 7189
-crit_rating = 1273
-haste_rating = 473
-mastery_rating = 716
-versatility_rating = 331
-
-crit_chance = crit_rating*0.1768/1273
-haste_percent = haste_rating*0.0696/473
-mastery_percent = mastery_rating*0.1343/716
-versatility_percent = versatility_rating*0.0389/331
-
-global_cd = Spells(0, 0, 1.5, 0)
-schism = Spells(1.29, 7.77, 1.5, 24)
-pain_dd = Spells(0.165, 0.858, 0, 0)
-smite = Spells(0.57, 3.26, 1.5, 0)
-solace = Spells(0.829, 5.11, 0, 12)
-pain_dot = Dots(0.992, 1.31, 16, 2, 0, 0)
-penance = Channeled(1.2, 0.726, 3, 2, 9)
-divine_star = Star(0.8, 0, 15)
-
-timeline = Timeline()
-mob_number = 1
-
-mob_min_hp = 1000000
-mob_max_hp = 1000000
-
-print(f'Haste: {haste_percent:.2%}')
-print(f'Crit: {crit_chance:.2%}')
-print(f'Mastery: {mastery_percent:.2%}')
-print(f'Versatility: {versatility_percent:.2%}\n')
-
-timeline, mob_number, pain_dot, penance, divine_star = kill_one(timeline, mob_number, pain_dot, penance, divine_star)
+import argparse
+import collections
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from bulk import DEFAULTS, MAX_ITERATIONS, parse_job, simulate_job, trace_job
+from encounter import encounter
+from engine import PROFILE_FIELDS, Simulation, Stats
+from montecarlo import MODES, run_batch
+from rng import CritStream
+from sinks import TextSink
+
+PERCENTILES = (5, 25, 50, 75, 95)
+SUMMARY_COLUMNS = (('index', 'id') + PROFILE_FIELDS
+                   + ('seed', 'iterations', 'converged', 'time_to_kill_mean', 'time_to_kill_std', 'dps_mean', 'dps_std',
+                      'dps_ci_low', 'dps_ci_high') + tuple(f'dps_p{pct}' for pct in PERCENTILES) + ('error',))
+TRACE_COLUMNS = ('index', 'id', 'time', 'spell', 'damage', 'crit', 'error')
+
+
+def demo(seed=None, verbosity=2):
+    intellect = 7189
+    crit_rating = 1273
+    haste_rating = 473
+    mastery_rating = 716
+    versatility_rating = 331
+
+    stats = Stats(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating)
+    sim = Simulation(stats, sink=TextSink(verbosity), rng=CritStream(seed))
+    mob_count = 1
+
+    mob_min_hp = 1000000
+    mob_max_hp = 1000000
+    iterations = 1000
+
+    print(f'Haste: {stats.haste_percent:.2%}')
+    print(f'Crit: {stats.crit_chance:.2%}')
+    print(f'Mastery: {stats.mastery_percent:.2%}')
+    print(f'Versatility: {stats.versatility_percent:.2%}\n')
+
+    for mob in encounter(sim, mob_min_hp, mob_max_hp, mobs=mob_count):
+        print(f'Mob {mob.number} took {mob.damage:,} damage over {mob.duration:.2f}s, {mob.dps:,.2f} DPS, with '
+              f'{mob.overkill:,} overkill.')
+
+    summary = run_batch(stats, iterations, mob_max_hp, seed)
+    print(f'\nOver {iterations} runs: time to kill {summary.time_to_kill.mean:.2f}s '
+          f'(std {summary.time_to_kill.std:.2f}s), DPS {summary.dps.mean:,.2f} '
+          f'({summary.confidence:.0%} CI {summary.dps.ci[0]:,.2f} to {summary.dps.ci[1]:,.2f}).')
+    print('DPS percentiles: ' + ', '.join(f'p{pct} {value:,.2f}' for pct, value in summary.dps.percentiles.items()))
+
+
+def csv_value(value):
+    """A CSV cell as the number it holds, or the string itself if it is not one. Empty cells are None."""
+    if value is None or value.strip() == '':
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def read_profiles(stream, input_format):
+    """Yields the profiles of a JSONL or CSV stream one at a time, so inputs of any size are never held in memory.
+
+    JSONL lines are objects; CSV files have a header row and leave a cell empty to use the default. Either uses the
+    field names of bulk.parse_job. Lines that are not valid JSON are yielded as None, to be reported as errors."""
+    if input_format == 'csv':
+        for row in csv.DictReader(stream):
+            profile = {name: csv_value(value) for name, value in row.items()
+                       if name != 'id' and csv_value(value) is not None}
+            if row.get('id'):
+                profile['id'] = row['id']
+            yield profile
+        return
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def profile_jobs(profiles, defaults):
+    """Turns profiles into jobs for bulk.simulate_job or bulk.trace_job. Profiles that fail validation are yielded as
+    the error result they will be written as."""
+    for index, profile in enumerate(profiles):
+        try:
+            yield parse_job(index, profile, defaults)
+        except ValueError as error:
+            yield {'index': index, 'id': profile.get('id') if isinstance(profile, dict) else None,
+                   'error': str(error)}
+
+
+def run_jobs(fn, jobs, workers):
+    """Yields fn(job) for every job in input order, running them across workers processes.
+
+    At most a few jobs per worker are in flight at once, so memory stays flat however many jobs there are. Jobs that
+    already failed validation are passed through as their error result."""
+    if workers == 1:
+        for job in jobs:
+            yield job if 'error' in job else fn(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = collections.deque()
+        for job in jobs:
+            in_flight.append(job if 'error' in job else pool.submit(fn, job))
+            if len(in_flight) >= 4*workers:
+                first = in_flight.popleft()
+                yield first if isinstance(first, dict) else first.result()
+        while in_flight:
+            first = in_flight.popleft()
+            yield first if isinstance(first, dict) else first.result()
+
+
+def summary_rows(result):
+    """The output row of a simulate_job result."""
+    row = {'index': result['index'], 'id': result['id'], 'error': result.get('error')}
+    row.update(result.get('profile', {}))
+    row['seed'] = result.get('seed')
+    summary = result.get('summary')
+    if summary is not None:
+        dps = summary['dps']
+        row.update({'iterations': summary['iterations'], 'converged': summary['converged'],
+                    'time_to_kill_mean': summary['time_to_kill']['mean'],
+                    'time_to_kill_std': summary['time_to_kill']['std'], 'dps_mean': dps['mean'], 'dps_std': dps['std'],
+                    'dps_ci_low': dps['ci'][0], 'dps_ci_high': dps['ci'][1]})
+        row.update({f'dps_p{pct}': dps['percentiles'][str(pct)] for pct in PERCENTILES})
+    return [row]
+
+
+def trace_rows(result):
+    """The output rows of a trace_job result, one per hit, or a single row holding its error."""
+    if 'error' in result:
+        return [{'index': result['index'], 'id': result['id'], 'error': result['error']}]
+    return [{'index': result['index'], 'id': result['id'], 'time': time, 'spell': spell, 'damage': damage,
+             'crit': crit} for time, spell, damage, crit in result['hits']]
+
+
+class RowWriter:
+    """Writes rows as CSV or JSONL and flushes the stream every chunk_size rows, so output shows up while a long batch
+    is still running."""
+    def __init__(self, stream, output_format, columns, chunk_size=1000):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.unflushed = 0
+        self.csv = None
+        if output_format == 'csv':
+            self.csv = csv.DictWriter(stream, columns, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.csv is not None:
+            self.csv.writerow(row)
+        else:
+            self.stream.write(json.dumps({name: value for name, value in row.items() if value is not None}) + '\n')
+        self.unflushed += 1
+        if self.unflushed >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.stream.flush()
+        self.unflushed = 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulates stat profiles in bulk. Without a profile file it runs a '
+                                                 'demo fight and prints every hit.')
+    parser.add_argument('profiles', nargs='?',
+                        help='JSONL or CSV file of stat profiles, - for stdin. Each needs ' + ', '.join(PROFILE_FIELDS)
+                             + ' and may give id, iterations, seed, mob_hp, precision and mode')
+    parser.add_argument('--input-format', help='jsonl or csv, by default taken from the file extension, else jsonl')
+    parser.add_argument('--format', default='csv', help='output format, csv (default) or jsonl')
+    parser.add_argument('--output', '-o', default='-', help='output file, stdout by default')
+    parser.add_argument('--iterations', type=int, default=DEFAULTS['iterations'],
+                        help=f'runs per profile, or per batch with --precision, {DEFAULTS["iterations"]} by default')
+    parser.add_argument('--precision', type=float,
+                        help='stop each profile once its mean DPS is within this relative margin, e.g. 0.002')
+    parser.add_argument('--seed', type=int, help=f'{DEFAULTS["seed"]} by default, a fresh seed for the demo')
+    parser.add_argument('--mob-hp', type=int, default=DEFAULTS['mob_hp'])
+    parser.add_argument('--mode', default=DEFAULTS['mode'], help=f'{" or ".join(MODES)}')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, 1 runs everything in this one')
+    parser.add_argument('--traces', action='store_true', help="write every hit of each profile's first run instead "
+                                                              "of summaries")
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows written between flushes')
+    args = parser.parse_args(argv)
+
+    if args.profiles is None:
+        demo(args.seed)
+        return 0
+    input_format = args.input_format
+    if input_format is None:
+        input_format = 'csv' if args.profiles.lower().endswith('.csv') else 'jsonl'
+    if input_format not in ('csv', 'jsonl') or args.format not in ('csv', 'jsonl'):
+        parser.error('formats must be csv or jsonl')
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be at least 1')
+    if not 1 <= args.iterations <= MAX_ITERATIONS:
+        parser.error(f'--iterations must be from 1 to {MAX_ITERATIONS}')
+
+    defaults = {'iterations': args.iterations, 'seed': DEFAULTS['seed'] if args.seed is None else args.seed,
+                'mob_hp': args.mob_hp, 'precision': args.precision, 'mode': args.mode}
+    fn, rows, columns = ((trace_job, trace_rows, TRACE_COLUMNS) if args.traces
+                         else (simulate_job, summary_rows, SUMMARY_COLUMNS))
+    source = sys.stdin if args.profiles == '-' else open(args.profiles, newline='')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    errors = 0
+    try:
+        writer = RowWriter(output, args.format, columns, args.chunk_size)
+        for result in run_jobs(fn, profile_jobs(read_profiles(source, input_format), defaults), args.workers):
+            errors += 'error' in result
+            for row in rows(result):
+                writer.write(row)
+        writer.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    if errors:
+        print(f'{errors} profile(s) could not be simulated.', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
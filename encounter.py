@@ -0,0 +1,67 @@
+import itertools
+
+# Hitpoints of a boss that is fought for a fixed time rather than until it dies.
+BOSS_HP = 2**62
+
+
+class MobResult:
+    """What happened to one mob of an encounter: when it spawned and ended, the damage it took and whether it died.
+
+    damage stops at the mob's hp, so dps is the rate it was brought down at. overkill is how far the killing hit went
+    past that."""
+    __slots__ = ('number', 'hp', 'spawned', 'ended', 'damage', 'died', 'overkill')
+
+    def __init__(self, number, hp, spawned, ended, damage, died, overkill=0):
+        self.number = number
+        self.hp = hp
+        self.spawned = spawned
+        self.ended = ended
+        self.damage = damage
+        self.died = died
+        self.overkill = overkill
+
+    @property
+    def duration(self):
+        return self.ended - self.spawned
+
+    @property
+    def dps(self):
+        return self.damage/self.duration if self.duration > 0 else 0.0
+
+    def as_dict(self):
+        return {'number': self.number, 'hp': self.hp, 'spawned': self.spawned, 'ended': self.ended,
+                'damage': self.damage, 'dps': self.dps, 'died': self.died, 'overkill': self.overkill}
+
+
+def encounter(sim, mob_min_hp=None, mob_max_hp=None, mobs=None, duration=None):
+    """Fights mobs one after another with sim and yields a MobResult as each one ends.
+
+    Each mob's HP is drawn from mob_min_hp to mob_max_hp with the simulation's rng. Without any HP the encounter is a
+    single boss that is fought until duration runs out. Cooldowns, the SW: Pain DoT, the Schism debuff and the clock
+    all carry over from one mob to the next. The encounter ends after mobs mobs have died or once the clock passes
+    duration, whichever comes first, and the last mob is then yielded alive. With neither it goes on until the caller
+    stops iterating. Nothing is kept from earlier mobs, so memory stays constant however long the encounter runs."""
+    if mob_min_hp is None and duration is None:
+        raise ValueError('A boss without hitpoints needs a duration.')
+    if mob_max_hp is None:
+        mob_max_hp = mob_min_hp
+    until = float('inf') if duration is None else duration
+    numbers = itertools.count(1) if mobs is None else range(1, mobs+1)
+    for number in numbers:
+        if mob_min_hp is None:
+            hp = None
+            start_hp = BOSS_HP
+        else:
+            hp = start_hp = int(sim.rng.randrange(mob_min_hp, mob_max_hp+1))
+        spawned = sim.now
+        sim.sink.mob_spawned(number, hp, spawned)
+        ended = sim.kill_one(start_hp, until)
+        died = sim.mob_hp <= 0
+        if died:
+            sim.sink.mob_died(number, ended)
+        else:
+            ended = duration
+        overkill = max(0, -sim.mob_hp)
+        yield MobResult(number, hp, spawned, ended, start_hp - sim.mob_hp - overkill, died, overkill)
+        if not died:
+            return
@@ -0,0 +1,305 @@
+import heapq
+from functools import partial
+from apl import DEFAULT_APL
+from instrumentation import metrics
+from rng import CritStream
+from sinks import NullSink
+from spelltable import SPELL_TABLE
+
+
+# Bump whenever a change alters simulated results. Stored results are keyed by it, so those of older engines are
+# never served and are dropped when a result store is opened.
+ENGINE_VERSION = 2
+# Fights that go on longer than this many seconds are given up on. A priority list whose conditions never let it cast
+# a damaging spell would otherwise never kill anything.
+MAX_FIGHT_DURATION = 24*3600
+
+# Percentage points of each secondary stat that one point of rating gives, e.g. 1273 crit rating for 17.68% crit.
+CRIT_PER_RATING = 0.1768/1273
+HASTE_PER_RATING = 0.0696/473
+MASTERY_PER_RATING = 0.1343/716
+VERSATILITY_PER_RATING = 0.0389/331
+# Spell names reported to sinks. Their positions are the spell ids of the table, which schedule.py uses too.
+SPELL_NAMES = SPELL_TABLE.names
+# Steps of Simulation.spell_event: a hit of a cast, a tick of a periodic effect and its partial last tick.
+CAST_HIT = 0
+TICK = 1
+LAST_TICK = 2
+# The arguments of Stats in order, as profiles name them in requests, files and tables.
+PROFILE_FIELDS = ('intellect', 'crit_rating', 'haste_rating', 'mastery_rating', 'versatility_rating')
+
+
+class Stats:
+    """Converts gear ratings into the percentages used by the simulation."""
+    __slots__ = ('intellect', 'crit_rating', 'haste_rating', 'mastery_rating', 'versatility_rating', 'crit_chance',
+                 'haste_percent', 'mastery_percent', 'versatility_percent')
+
+    def __init__(self, intellect, crit_rating, haste_rating, mastery_rating, versatility_rating):
+        self.intellect = intellect
+        self.crit_rating = crit_rating
+        self.haste_rating = haste_rating
+        self.mastery_rating = mastery_rating
+        self.versatility_rating = versatility_rating
+        self.crit_chance = crit_rating*CRIT_PER_RATING
+        self.haste_percent = haste_rating*HASTE_PER_RATING
+        self.mastery_percent = mastery_rating*MASTERY_PER_RATING
+        self.versatility_percent = versatility_rating*VERSATILITY_PER_RATING
+
+
+class Spellbook:
+    """The numbers of every spell in a SpellTable for one stat profile, one tuple per field in spell id order.
+
+    It is never modified after it is built, so any number of Simulations, in any number of threads, can share one."""
+    __slots__ = ('stats', 'table', 'gcd', 'damages', 'cast_times', 'hit_intervals', 'gcds', 'events')
+
+    def __init__(self, stats, table=None):
+        table = SPELL_TABLE if table is None else table
+        self.stats = stats
+        self.table = table
+        haste = 1+stats.haste_percent
+        self.gcd = table.gcd/haste
+        damages = [(table.sp_weights[spell]*stats.intellect + table.sp_biases[spell])/table.hits[spell]
+                   for spell in range(len(table))]
+        self.damages = tuple(damages[spell] if table.damage_of[spell] is None else damages[table.damage_of[spell]]
+                             for spell in range(len(table)))
+        self.cast_times = tuple(cast_time/haste for cast_time in table.cast_times)
+        hit_intervals = []
+        for spell in range(len(table)):
+            if table.periodic[spell]:
+                hit_intervals.append(table.tick_intervals[spell]/haste)
+            elif table.channel_durations[spell] is not None:
+                hit_intervals.append((table.channel_durations[spell]/haste)/table.hits[spell])
+            else:
+                hit_intervals.append(table.hit_intervals[spell])
+        self.hit_intervals = tuple(hit_intervals)
+        self.gcds = tuple(self.gcd if gcd == 'gcd' else gcd for gcd in table.gcds)
+        # Everything Simulation.spell_event needs about each event, gathered into one tuple that it unpacks in one
+        # step. The step is CAST_HIT, TICK or LAST_TICK.
+        self.events = {}
+        for event, (spell, last_tick) in table.event_spells.items():
+            step = (LAST_TICK if last_tick else TICK) if table.periodic[spell] else CAST_HIT
+            self.events[event] = (spell, step, self.damages[spell], table.events[spell], table.last_events[spell],
+                                  table.hits[spell], self.hit_intervals[spell], table.cooldowns[spell],
+                                  table.debuff_durations[spell], table.applies[spell], self.gcds[spell],
+                                  table.next_spell[spell])
+
+    def spell_damages(self):
+        """Returns the damage of one non-crit, unbuffed hit of each spell before versatility, in spell id order."""
+        return self.damages
+
+
+class EventQueue:
+    """A heap of (time, priority, sequence, kind) records with one live event per kind.
+
+    Scheduling a kind that is already pending cancels the older record. Cancelled records are left in the heap and
+    skipped when they reach the top, so scheduling and cancelling are both O(log n) regardless of how many kinds of
+    events have been registered."""
+    __slots__ = ('heap', 'pending', 'handlers', 'priorities', 'sequence')
+
+    def __init__(self):
+        self.heap = []
+        self.pending = {}
+        self.handlers = {}
+        self.priorities = {}
+        self.sequence = 0
+
+    def register(self, kind, handler, priority):
+        """Registers the function that is called when an event of this kind comes due."""
+        self.handlers[kind] = handler
+        self.priorities[kind] = priority
+
+    def schedule(self, kind, time):
+        """Adds an event, replacing any pending event of the same kind."""
+        self.sequence += 1
+        self.pending[kind] = self.sequence
+        heapq.heappush(self.heap, (time, self.priorities[kind], self.sequence, kind))
+
+    def cancel(self, kind):
+        """Drops the pending event of this kind, if there is one."""
+        self.pending.pop(kind, None)
+
+    def is_pending(self, kind):
+        return kind in self.pending
+
+    def next_time(self):
+        """Discards cancelled records from the top of the heap and returns the time of the next live event."""
+        heap = self.heap
+        pending = self.pending
+        while heap:
+            _, _, sequence, kind = heap[0]
+            if pending.get(kind) == sequence:
+                return heap[0][0]
+            heapq.heappop(heap)
+        return float('inf')
+
+    def clear(self):
+        self.heap.clear()
+        self.pending.clear()
+
+
+class Simulation:
+    """Holds the cooldowns and event queue for one character fighting one mob at a time.
+
+    All of the state of a fight lives on the instance, so independent Simulations can run side by side in threads.
+    stats may be a Stats or a Spellbook; passing a Spellbook shares its spells instead of building them again. Crits
+    are rolled from rng, which defaults to a CritStream from rng.py with a fresh seed. Hits are reported to sink, an
+    EventSink from sinks.py, which defaults to a NullSink. Spells are chosen by apl, a PriorityList from apl.py, which
+    defaults to the app's usual rotation."""
+    __slots__ = ('spellbook', 'stats', 'table', 'sink', 'on_hit', 'rng', 'crit_chance', 'crit_total',
+                 'versatility_percent', 'damage_taken', 'cast_times', 'hit_intervals', 'gcd',
+                 'queue', 'mob_hp', 'now', 'started', 'ready', 'hit_counts', 'last_tick_coeffs', 'debuff_end', 'apl',
+                 'apl_next_spell', 'apl_ready_bound')
+    # Whether instances count toward metrics. Subclasses that replay the rotation for something other than a fight
+    # turn it off.
+    instrumented = True
+
+    def __init__(self, stats, sink=None, rng=None, apl=None):
+        if not isinstance(stats, Spellbook):
+            stats = Spellbook(stats, None if apl is None else apl.table)
+        self.spellbook = stats
+        self.stats = stats.stats
+        self.table = stats.table
+        self.sink = NullSink() if sink is None else sink
+        # Bound once here so that the hot loop pays a single None check when hits are not wanted.
+        self.on_hit = self.sink.hit if self.sink.wants_hits else None
+        self.rng = CritStream() if rng is None else rng
+        self.crit_chance = self.stats.crit_chance
+        # A roll is a crit when random()*crit_total < crit_chance, the test random.choices([True, False],
+        # weights=[crit_chance, 1-crit_chance]) makes, without building lists for every hit.
+        self.crit_total = self.stats.crit_chance + (1-self.stats.crit_chance)
+        self.versatility_percent = self.stats.versatility_percent
+        self.damage_taken = self.table.damage_taken
+
+        self.cast_times = stats.cast_times
+        self.hit_intervals = stats.hit_intervals
+        self.gcd = stats.gcd
+        self.apl = DEFAULT_APL if apl is None else apl
+        if self.apl.table is not self.table:
+            raise ValueError('The priority list was built for a different spell table.')
+        self.apl_next_spell = self.apl.compile()
+
+        self.queue = EventQueue()
+        # Every spell event goes to the one generic handler, along with what it needs to know about the event.
+        for priority, kind in enumerate(self.table.event_order):
+            handler = self.gcd_end if kind == 'gcd_end' else partial(self.spell_event, stats.events[kind])
+            self.queue.register(kind, handler, priority)
+
+        self.mob_hp = 0
+        self.reset()
+        # Checked once per Simulation, so instrumentation that is off costs nothing per event.
+        if metrics.enabled and self.instrumented:
+            metrics.instrument(self)
+
+    def reset(self):
+        """Puts the character back at time zero with every spell off cooldown."""
+        self.queue.clear()
+        self.now = 0
+        self.started = False
+        # When each spell is off cooldown, or for periodic spells, when they run out.
+        self.ready = [0]*len(self.table)
+        # Hits of the current cast of each multi-hit spell that have landed so far.
+        self.hit_counts = [0]*len(self.table)
+        self.last_tick_coeffs = [0]*len(self.table)
+        # Damage taken is raised by damage_taken until debuff_end.
+        self.debuff_end = 0
+        self.apl_ready_bound = 0
+
+    def hit(self, spell, spell_damage, coeff=1):
+        """Rolls for a crit and applies one hit of spell_damage from the spell with id spell to the mob."""
+        crit_boolean = self.rng.random()*self.crit_total < self.crit_chance
+        if self.now <= self.debuff_end:
+            debuff = True
+        else:
+            debuff = False
+        damage = int(spell_damage*(1+self.versatility_percent)*(1+debuff*self.damage_taken)*coeff)
+        if crit_boolean:
+            damage *= 2
+        self.mob_hp -= damage
+        if self.on_hit is not None:
+            self.on_hit(self.table.names[spell], self.now, damage, crit_boolean, self.mob_hp)
+
+    def spell_event(self, event_row):
+        """Lands one hit of a spell and moves its cast, channel or periodic effect along as its table row says.
+
+        event_row is the entry of Spellbook.events for the event that came due."""
+        (spell, step, damage, event, last_event, hits, interval, cooldown, debuff_duration, applied, gcd,
+         next_spell) = event_row
+        now = self.now
+        if step:
+            if step == LAST_TICK:
+                self.hit(spell, damage, self.last_tick_coeffs[spell])
+                self.ready[spell] = 0
+                return
+            self.hit(spell, damage)
+            # This sets when the next tick will occur.
+            if now + interval <= self.ready[spell]:
+                self.queue.schedule(event, now + interval)
+            else:
+                self.last_tick_coeffs[spell] = (self.ready[spell] - now)/interval
+                self.queue.schedule(last_event, self.ready[spell])
+            return
+
+        self.hit(spell, damage)
+        count = self.hit_counts[spell]
+        if not count:
+            if cooldown:
+                self.ready[spell] = now + cooldown
+            if debuff_duration:
+                self.debuff_end = now + debuff_duration
+            if applied is not None:
+                self.ready[applied] = now + self.table.durations[applied]
+                self.queue.schedule(self.table.events[applied], now + self.hit_intervals[applied])
+            if gcd is not None:
+                self.queue.schedule('gcd_end', now + gcd)
+        if count + 1 < hits:
+            self.hit_counts[spell] = count + 1
+            self.queue.schedule(event, now + interval)
+        else:
+            if count:
+                self.hit_counts[spell] = 0
+            if next_spell:
+                self.next_spell()
+
+    def gcd_end(self):
+        self.next_spell()
+
+    def next_spell(self):
+        """After certain spells are cast or the GCD expires, this casts the first spell of the priority list that is
+        ready and whose conditions hold."""
+        self.apl_next_spell(self)
+
+    def kill_one(self, mob_hp, until=float('inf')):
+        """Fights a mob with mob_hp hitpoints from the current state and returns the time at which it dies.
+
+        Stops early, with the mob still alive and the events after until left pending, once the next event would
+        come after until seconds. The time of the last event handled is returned then. Without a finite until, as by
+        default, raises ValueError if the mob is still alive MAX_FIGHT_DURATION seconds after the call."""
+        self.mob_hp = mob_hp
+        give_up = until == float('inf')
+        if give_up:
+            until = self.now + MAX_FIGHT_DURATION
+        if not self.started:
+            self.started = True
+            self.next_spell()
+        queue = self.queue
+        heap = queue.heap
+        pending = queue.pending
+        handlers = queue.handlers
+        heappop = heapq.heappop
+        while self.mob_hp > 0:
+            # Advance the clock once, then drain every event sharing that time stop, including any that the
+            # handlers add at the same time.
+            now = queue.next_time()
+            if now > until:
+                if give_up:
+                    raise ValueError(f'The mob was still alive after {MAX_FIGHT_DURATION:,} seconds. The priority list '
+                                     'may never cast a damaging spell.')
+                break
+            self.now = now
+            while heap and heap[0][0] == now and self.mob_hp > 0:
+                _, _, sequence, kind = heappop(heap)
+                if pending.get(kind) != sequence:
+                    continue
+                del pending[kind]
+                handlers[kind]()
+        return self.now
@@ -0,0 +1,70 @@
+import itertools
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError
+
+
+class Superseded(Exception):
+    """Raised when a newer request from the same session replaced this one."""
+
+
+class SimulationTimeout(Exception):
+    """Raised when a simulation does not finish within the executor's timeout."""
+
+
+class SimulationExecutor:
+    """Runs simulations in a process pool where the latest request of each session wins.
+
+    Submitting a job for a session cancels that session's previous job if it has not started yet. If it has started,
+    its result is dropped when it arrives. Waiting for a job gives up after timeout seconds. A job that is already
+    running in a worker cannot be interrupted, so it finishes in the background and its result is discarded."""
+    def __init__(self, workers=None, timeout=10):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.timeout = timeout
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.generations = itertools.count()
+
+    def submit(self, session, fn, *args):
+        """Queues fn(*args) as the session's latest job and returns (generation, future)."""
+        future = self.pool.submit(fn, *args)
+        with self.lock:
+            generation = next(self.generations)
+            previous = self.latest.get(session)
+            self.latest[session] = (generation, future)
+        if previous is not None:
+            previous[1].cancel()
+        return generation, future
+
+    def is_latest(self, session, generation):
+        with self.lock:
+            latest = self.latest.get(session)
+            return latest is not None and latest[0] == generation
+
+    def forget(self, session, generation):
+        """Drops the session's entry once its latest job has been collected."""
+        with self.lock:
+            latest = self.latest.get(session)
+            if latest is not None and latest[0] == generation:
+                del self.latest[session]
+
+    def run(self, session, fn, *args):
+        """Runs fn(*args) for session and waits for the result.
+
+        Raises Superseded if a newer job for the session arrived first and SimulationTimeout if the job takes longer
+        than the executor's timeout."""
+        generation, future = self.submit(session, fn, *args)
+        try:
+            result = future.result(timeout=self.timeout)
+        except CancelledError:
+            raise Superseded()
+        except TimeoutError:
+            future.cancel()
+            self.forget(session, generation)
+            raise SimulationTimeout()
+        if not self.is_latest(session, generation):
+            raise Superseded()
+        self.forget(session, generation)
+        return result
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
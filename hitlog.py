@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class HitLog:
+    """Hits stored column by column in preallocated NumPy arrays: time, spell id, damage and crit flag.
+
+    The arrays double in size when they fill up, so appending does not allocate per hit. The column properties are
+    views of the filled part and copy nothing."""
+    def __init__(self, spell_names=(), capacity=256):
+        self.spell_names = list(spell_names)
+        self.spell_ids = {name: spell_id for spell_id, name in enumerate(self.spell_names)}
+        self.size = 0
+        self._times = np.empty(capacity)
+        self._spell_ids = np.empty(capacity, dtype=np.int8)
+        self._damages = np.empty(capacity, dtype=np.int64)
+        self._crits = np.empty(capacity, dtype=bool)
+
+    def __len__(self):
+        return self.size
+
+    def spell_id(self, spell_name):
+        """The id of spell_name, giving it the next free id if it has not been seen before."""
+        spell_id = self.spell_ids.get(spell_name)
+        if spell_id is None:
+            spell_id = self.spell_ids[spell_name] = len(self.spell_names)
+            self.spell_names.append(spell_name)
+        return spell_id
+
+    def reserve(self, capacity):
+        """Grows every column to hold at least capacity hits."""
+        if capacity <= len(self._times):
+            return
+        capacity = max(capacity, 2*len(self._times))
+        for name in ('_times', '_spell_ids', '_damages', '_crits'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def append(self, time, spell_id, damage, crit):
+        if self.size == len(self._times):
+            self.reserve(self.size + 1)
+        i = self.size
+        self._times[i] = time
+        self._spell_ids[i] = spell_id
+        self._damages[i] = damage
+        self._crits[i] = crit
+        self.size = i + 1
+
+    def extend(self, times, spell_ids, damages, crits):
+        """Appends whole arrays of hits at once."""
+        start = self.size
+        end = start + len(times)
+        self.reserve(end)
+        self._times[start:end] = times
+        self._spell_ids[start:end] = spell_ids
+        self._damages[start:end] = damages
+        self._crits[start:end] = crits
+        self.size = end
+
+    def clear(self):
+        self.size = 0
+
+    @property
+    def times(self):
+        return self._times[:self.size]
+
+    @property
+    def ids(self):
+        return self._spell_ids[:self.size]
+
+    @property
+    def damages(self):
+        return self._damages[:self.size]
+
+    @property
+    def crits(self):
+        return self._crits[:self.size]
+
+    def spell_mask(self, *spell_names):
+        """Boolean mask of the hits made by any of spell_names."""
+        return np.isin(self.ids, [self.spell_ids[name] for name in spell_names if name in self.spell_ids])
+
+    def for_spells(self, *spell_names):
+        """Times and damages of the hits made by any of spell_names."""
+        mask = self.spell_mask(*spell_names)
+        return self.times[mask], self.damages[mask]
+
+    def damage_by_spell(self):
+        """Total damage of each spell, computed in one pass over the columns."""
+        totals = np.bincount(self.ids, weights=self.damages, minlength=len(self.spell_names))
+        return dict(zip(self.spell_names, totals.tolist()))
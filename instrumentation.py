@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Help text of every metric, in the order they are exposed.
+METRICS = {'wowsim_events_total': ('counter', 'Events handled by the simulation engine, by kind.'),
+           'wowsim_time_stops_total': ('counter', 'Iterations of the event loop, one per distinct event time.'),
+           'wowsim_spell_casts_total': ('counter', 'Spell casts, by spell.'),
+           'wowsim_spell_hits_total': ('counter', 'Spell hits dealt by the event engine or sampled runs, by spell.'),
+           'wowsim_spell_crits_total': ('counter', 'Spell hits that crit, by spell.'),
+           'wowsim_simulations_total': ('counter', 'Fight simulations created while instrumentation was on.'),
+           'wowsim_batch_seconds': ('summary', 'Wall time of run_batch calls, by mode.'),
+           'wowsim_simulation_seconds': ('summary', 'Wall time of Dash simulations, including the wait for a worker.'),
+           'wowsim_figure_seconds': ('summary', 'Time spent building Dash figure data and results.'),
+           'wowsim_cache_hits_total': ('counter', 'Cache lookups that found an entry, by cache.'),
+           'wowsim_cache_misses_total': ('counter', 'Cache lookups that missed, by cache.'),
+           'wowsim_cache_entries': ('gauge', 'Entries currently held, by cache.')}
+
+
+class NullTimer:
+    """The timer handed out while instrumentation is off. It does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    """Counters and timers for the simulator, exposed in the Prometheus text format.
+
+    Instrumentation is off unless enabled, and then costs nothing on the hot path. Simulations are only instrumented
+    when they are created while it is on, by wrapping their event handlers and hit callback. Recording a schedule is
+    not a fight and is not counted; sampled schedules count their hits, crits and casts in bulk instead. count and
+    observe return at once and time hands out a shared do-nothing timer. Caches are registered once and read when
+    scraped.
+
+    Each process keeps its own numbers. Executor workers drain theirs after each Dash simulation and send them back
+    with the result, for the serving process to merge."""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = defaultdict(int)
+        self.summaries = defaultdict(lambda: [0.0, 0])
+        self.caches = {}
+        self.after_fork()
+        # A forked process reports its own work, not the numbers it inherited.
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+        self.counters.clear()
+        self.summaries.clear()
+        # The hit and miss counts of each cache the last time they were drained.
+        self.drained = {name: (cache.hits, cache.misses) for name, cache in self.caches.items()}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.summaries.clear()
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.summaries[key]
+            summary[0] += seconds
+            summary[1] += 1
+
+    def time(self, name, **labels):
+        """A context manager that records how long its block takes under name."""
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, labels)
+
+    def register_cache(self, name, cache):
+        """Exposes the hit, miss and size counts that an LRUCache keeps anyway."""
+        self.caches[name] = cache
+        self.drained[name] = (cache.hits, cache.misses)
+
+    def drain(self):
+        """Returns the counters and summaries gathered so far, with the cache hits and misses since the last drain, as
+        plain data for merge in another process, and resets them."""
+        with self.lock:
+            counters = dict(self.counters)
+            summaries = {key: tuple(summary) for key, summary in self.summaries.items()}
+            self.counters.clear()
+            self.summaries.clear()
+        for cache_name, cache in self.caches.items():
+            labels = (('cache', cache_name),)
+            counts = (cache.hits, cache.misses)
+            for name, count, drained in zip(('wowsim_cache_hits_total', 'wowsim_cache_misses_total'), counts,
+                                            self.drained[cache_name]):
+                if count > drained:
+                    counters[(name, labels)] = count - drained
+            self.drained[cache_name] = counts
+        return counters, summaries
+
+    def merge(self, drained):
+        """Adds what drain returned in another process to the numbers of this one. drained may be None."""
+        if not self.enabled or drained is None:
+            return
+        counters, summaries = drained
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] += value
+            for key, (total, count) in summaries.items():
+                summary = self.summaries[key]
+                summary[0] += total
+                summary[1] += count
+
+    def instrument(self, sim):
+        """Wraps the event handlers and hit callback of a Simulation so that they count events, time stops, casts and
+        hits."""
+        self.count('wowsim_simulations_total')
+        last_time = [None]
+        for kind, handler in list(sim.queue.handlers.items()):
+            sim.queue.handlers[kind] = self.counted_handler(sim, kind, handler, last_time)
+        forward = sim.on_hit
+        # A cast lands as the first hit of a spell that is not periodic, before hit_counts counts it.
+        casts = {name: spell for spell, name in enumerate(sim.table.names) if not sim.table.periodic[spell]}
+
+        def on_hit(spell_name, now, damage, crit, mob_hp):
+            spell = casts.get(spell_name)
+            if spell is not None and not sim.hit_counts[spell]:
+                self.count('wowsim_spell_casts_total', spell=spell_name)
+            self.count('wowsim_spell_hits_total', spell=spell_name)
+            if crit:
+                self.count('wowsim_spell_crits_total', spell=spell_name)
+            if forward is not None:
+                forward(spell_name, now, damage, crit, mob_hp)
+        sim.on_hit = on_hit
+
+    def counted_handler(self, sim, kind, handler, last_time):
+        def counted():
+            if sim.now != last_time[0]:
+                last_time[0] = sim.now
+                self.count('wowsim_time_stops_total')
+            self.count('wowsim_events_total', kind=kind)
+            handler()
+        return counted
+
+    def samples(self):
+        """Every series to expose as (metric, series name, labels, value), with a _sum and _count per summary."""
+        with self.lock:
+            counters = dict(self.counters)
+            samples = []
+            for (name, labels), (total, count) in self.summaries.items():
+                samples.append((name, name + '_sum', labels, total))
+                samples.append((name, name + '_count', labels, count))
+        # Cache lookups merged from workers add to those of this process's caches.
+        for cache_name, cache in self.caches.items():
+            stats = cache.stats()
+            labels = (('cache', cache_name),)
+            for name, field in (('wowsim_cache_hits_total', 'hits'), ('wowsim_cache_misses_total', 'misses')):
+                counters[(name, labels)] = counters.get((name, labels), 0) + stats[field]
+            samples.append(('wowsim_cache_entries', 'wowsim_cache_entries', labels, stats['size']))
+        samples.extend((name, name, labels, value) for (name, labels), value in counters.items())
+        return samples
+
+    def exposition(self):
+        """The current values in the Prometheus text exposition format."""
+        by_metric = defaultdict(list)
+        for base, name, labels, value in self.samples():
+            by_metric[base].append((name, labels, value))
+        lines = []
+        for base, (metric_type, help_text) in METRICS.items():
+            lines.append(f'# HELP {base} {help_text}')
+            lines.append(f'# TYPE {base} {metric_type}')
+            for name, labels, value in sorted(by_metric.get(base, ())):
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# The process-wide metrics. Set WOWSIM_METRICS=1 to turn them on at startup.
+metrics = Metrics(enabled=os.environ.get('WOWSIM_METRICS') == '1')
@@ -0,0 +1,196 @@
+import math
+from array import array
+from statistics import NormalDist
+import numpy as np
+from engine import Simulation, Stats
+from instrumentation import metrics
+from resultstore import result_key, result_store
+from rng import CritStream, seed_key
+from schedule import cached_schedule
+
+
+class MetricSummary:
+    """Mean, standard deviation, confidence interval of the mean and percentiles of one measurement."""
+    def __init__(self, mean, std, ci, percentiles):
+        self.mean = mean
+        self.std = std
+        self.ci = ci
+        self.percentiles = percentiles
+
+    @classmethod
+    def from_samples(cls, samples, confidence, percentiles):
+        samples = np.asarray(samples, dtype=float)
+        mean = float(samples.mean())
+        std = float(samples.std(ddof=1)) if len(samples) > 1 else 0.0
+        half_width = NormalDist().inv_cdf(0.5 + confidence/2)*std/math.sqrt(len(samples))
+        return cls(mean, std, (mean - half_width, mean + half_width),
+                   dict(zip(percentiles, np.percentile(samples, percentiles).tolist())))
+
+    def as_dict(self):
+        return {'mean': self.mean, 'std': self.std, 'ci': list(self.ci),
+                'percentiles': {str(pct): value for pct, value in self.percentiles.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        """The MetricSummary that as_dict turned into data."""
+        percentiles = {}
+        for pct, value in data['percentiles'].items():
+            pct = float(pct)
+            percentiles[int(pct) if pct.is_integer() else pct] = value
+        return cls(data['mean'], data['std'], tuple(data['ci']), percentiles)
+
+
+class BatchSummary:
+    """Summary statistics of time-to-kill and DPS over a batch of kill_one runs.
+
+    precision is the relative half-width of the DPS confidence interval an adaptive batch aimed for, None for a fixed
+    number of runs."""
+    def __init__(self, iterations, mob_hp, confidence, time_to_kill, dps, precision=None):
+        self.iterations = iterations
+        self.mob_hp = mob_hp
+        self.confidence = confidence
+        self.time_to_kill = time_to_kill
+        self.dps = dps
+        self.precision = precision
+
+    @classmethod
+    def from_kill_times(cls, kill_times, mob_hp, confidence, percentiles, precision=None):
+        kill_times = np.asarray(kill_times, dtype=float)
+        return cls(len(kill_times), mob_hp, confidence,
+                   MetricSummary.from_samples(kill_times, confidence, percentiles),
+                   MetricSummary.from_samples(mob_hp/kill_times, confidence, percentiles), precision)
+
+    @property
+    def converged(self):
+        """Whether the DPS confidence interval is within the precision target. Always true without a target."""
+        if self.precision is None:
+            return True
+        return (self.dps.ci[1] - self.dps.ci[0])/2 <= self.precision*self.dps.mean
+
+    def as_dict(self):
+        return {'iterations': self.iterations, 'mob_hp': self.mob_hp, 'confidence': self.confidence,
+                'precision': self.precision, 'converged': self.converged,
+                'time_to_kill': self.time_to_kill.as_dict(), 'dps': self.dps.as_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        """The BatchSummary that as_dict turned into data."""
+        return cls(data['iterations'], data['mob_hp'], data['confidence'],
+                   MetricSummary.from_dict(data['time_to_kill']), MetricSummary.from_dict(data['dps']),
+                   data.get('precision'))
+
+
+def event_kill_times(stats, iterations, mob_hp, seed=None, apl=None, first_run=0):
+    """Runs the event engine iterations times, numbering the runs from first_run, and returns the kill time of each.
+
+    Run r rolls its crits from its own CritStream, so it matches run r of vectorized_kill_times with the same seed."""
+    key = seed_key(seed)
+    sim = Simulation(stats, apl=apl)
+    kill_times = array('d')
+    for run in range(first_run, first_run + iterations):
+        sim.reset()
+        sim.rng = CritStream(run=run, key=key)
+        kill_times.append(sim.kill_one(mob_hp))
+    return np.frombuffer(kill_times)
+
+
+def vectorized_kill_times(stats, iterations, mob_hp, seed=None, apl=None, first_run=0):
+    """Builds the cast schedule once and samples the crits of every run with NumPy."""
+    return cached_schedule(stats, mob_hp, apl).kill_times(stats, mob_hp, iterations, seed, first_run=first_run)
+
+
+def expected_summary(stats, mob_hp, confidence, percentiles, apl=None):
+    """Summarizes the expected time-to-kill and DPS of one schedule without drawing any random numbers.
+
+    Both come from the schedule's kill_distribution, a normal approximation of the chance each hit is the killing
+    one, so they track the Monte Carlo means closely but not exactly. Nothing is sampled, so the confidence interval
+    collapses to the mean."""
+    times, probabilities = cached_schedule(stats, mob_hp, apl).kill_distribution(stats, mob_hp)
+    quantiles = np.asarray(percentiles)/100
+
+    def metric(values, probabilities):
+        """Summarizes values, given in ascending order, that occur with the given probabilities."""
+        mean = float(values @ probabilities)
+        std = math.sqrt(max(0.0, float(values*values @ probabilities) - mean*mean))
+        indices = np.minimum(np.searchsorted(np.cumsum(probabilities), quantiles), len(values) - 1)
+        return MetricSummary(mean, std, (mean, mean), dict(zip(percentiles, values[indices].tolist())))
+
+    # Hit times only grow, so DPS is in ascending order backwards.
+    return BatchSummary(0, mob_hp, confidence, metric(times, probabilities),
+                        metric(mob_hp/times[::-1], probabilities[::-1]))
+
+
+MODES = {'event': event_kill_times, 'vectorized': vectorized_kill_times}
+
+
+def adaptive_kill_times(stats, batch_size, mob_hp, seed, apl, mode, precision, confidence, max_iterations):
+    """Makes runs batch_size at a time until the confidence interval of the mean DPS is within precision of the mean,
+    or max_iterations runs have been made, and returns the kill time of every run.
+
+    Batches continue the numbering of the runs before them, so stopping after n runs gives exactly the kill times of a
+    fixed batch of n. The running mean and variance are merged batch by batch, so checking costs nothing per run, and
+    after the first batch each one is sized to what the estimate so far says the target needs."""
+    if seed is None:
+        # Every batch has to draw from the same stream, so a fresh seed is drawn once here.
+        seed = seed_key()
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    batches = []
+    count, mean, squares = 0, 0.0, 0.0
+    runs = batch_size
+    while count < max_iterations:
+        kill_times = MODES[mode](stats, min(runs, max_iterations - count), mob_hp, seed, apl, count)
+        batches.append(kill_times)
+        dps = mob_hp/kill_times
+        batch_mean = float(dps.mean())
+        batch_squares = float(((dps - batch_mean)**2).sum())
+        total = count + len(dps)
+        delta = batch_mean - mean
+        mean += delta*len(dps)/total
+        squares += batch_squares + delta*delta*count*len(dps)/total
+        count = total
+        if count < 2:
+            continue
+        std = math.sqrt(squares/(count - 1))
+        if z*std/math.sqrt(count) <= precision*mean:
+            break
+        # The next batch goes straight to the number of runs the current estimate says the target needs.
+        runs = max(batch_size, math.ceil((z*std/(precision*mean))**2) - count)
+    return np.concatenate(batches)
+
+
+def run_batch(stats, iterations=1000, mob_hp=500000, seed=None, confidence=0.95, percentiles=(5, 25, 50, 75, 95),
+              mode='vectorized', expected_only=False, apl=None, precision=None, max_iterations=100000):
+    """Runs kill_one iterations times for one stat profile and summarizes time-to-kill and DPS.
+
+    mode 'event' steps the event engine once per run. mode 'vectorized' evaluates every run at once from a shared cast
+    schedule. Both draw the crits of run r from the same rng substream, so they give the same kill times for the same
+    seed. Only the kill time of each run is kept, never the individual hits. expected_only skips sampling and returns
+    an analytic approximation of the expectation with iterations set to 0. apl is the PriorityList to cast from, the
+    default rotation if None.
+
+    precision, a relative half-width such as 0.002 for a mean DPS within 0.2% at the given confidence, makes the batch
+    adaptive: runs are made iterations at a time until the target is met or max_iterations runs have been made.
+    Low-variance profiles stop after far fewer runs than noisy ones. The summary's converged tells whether the target
+    was met.
+
+    Seeded batches are read from result_store when one is configured, and stored there after they are simulated."""
+    if not isinstance(stats, Stats):
+        stats = Stats(*stats)
+    if expected_only:
+        return expected_summary(stats, mob_hp, confidence, percentiles, apl)
+    key = None
+    if result_store is not None and seed is not None:
+        key = result_key(stats, iterations, mob_hp, seed, confidence, percentiles, apl, precision, max_iterations)
+        stored = result_store.get(key)
+        if stored is not None:
+            return BatchSummary.from_dict(stored)
+    with metrics.time('wowsim_batch_seconds', mode=mode):
+        if precision is None:
+            kill_times = MODES[mode](stats, iterations, mob_hp, seed, apl)
+        else:
+            kill_times = adaptive_kill_times(stats, iterations, mob_hp, seed, apl, mode, precision, confidence,
+                                             max_iterations)
+    summary = BatchSummary.from_kill_times(kill_times, mob_hp, confidence, percentiles, precision)
+    if key is not None:
+        result_store.put(key, summary.as_dict())
+    return summary
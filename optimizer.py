@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from engine import CRIT_PER_RATING, VERSATILITY_PER_RATING, Stats
+from montecarlo import BatchSummary, vectorized_kill_times
+from schedule import schedule_for
+
+OBJECTIVES = ('dps', 'time_to_kill')
+
+
+class OptimizerResult:
+    """The best rating allocation found, the finalists that were fully simulated and how many were screened."""
+    def __init__(self, objective, candidates, finalists):
+        self.objective = objective
+        self.candidates = candidates
+        # (profile, expected time-to-kill, BatchSummary) for each finalist, best first.
+        self.finalists = finalists
+
+    @property
+    def best(self):
+        return self.finalists[0][0]
+
+    @property
+    def best_summary(self):
+        return self.finalists[0][2]
+
+    def as_dict(self):
+        return {'objective': self.objective, 'candidates': self.candidates,
+                'finalists': [{'profile': list(profile), 'expected_time_to_kill': expected,
+                               'summary': summary.as_dict()} for profile, expected, summary in self.finalists]}
+
+
+def interpolated_kill_times(times, cumulative_damage, targets):
+    """Time at which cumulative_damage reaches each target, interpolated between the surrounding hits.
+
+    Kill times of whole hits tie across many allocations. Interpolating gives the screening a continuous score."""
+    kill_hits = np.searchsorted(cumulative_damage, targets)
+    previous_damage = np.where(kill_hits > 0, cumulative_damage[kill_hits - 1], 0)
+    previous_times = np.where(kill_hits > 0, times[kill_hits - 1], 0.0)
+    fraction = (targets - previous_damage)/(cumulative_damage[kill_hits] - previous_damage)
+    return previous_times + (times[kill_hits] - previous_times)*fraction
+
+
+def screen(intellect, budget, step, mob_hp):
+    """Expected time-to-kill of every allocation of budget to crit, haste and versatility in multiples of step.
+
+    Whatever is left over goes to mastery. One schedule is built per haste value and every crit and versatility
+    value for it is evaluated with array operations."""
+    levels = np.arange(0, budget + 1, step)
+    crits, hastes, versatilities, kill_times = [], [], [], []
+    for haste_rating in levels:
+        # Zero crit and versatility is the slowest kill, so a schedule that covers it covers every candidate.
+        stats = Stats(intellect, 0, haste_rating, 0, 0)
+        schedule = schedule_for(stats, mob_hp)
+        remaining = levels[levels <= budget - haste_rating]
+        damage = schedule.hit_damage(stats, remaining*VERSATILITY_PER_RATING)
+        cumulative = np.cumsum(damage, axis=1)
+        for versatility_rating, row in zip(remaining, cumulative):
+            crit_ratings = remaining[remaining <= budget - haste_rating - versatility_rating]
+            crit_chances = crit_ratings*CRIT_PER_RATING
+            kill_times.append(interpolated_kill_times(schedule.times, row, mob_hp/(1+crit_chances)))
+            crits.append(crit_ratings)
+            hastes.append(np.full(len(crit_ratings), haste_rating))
+            versatilities.append(np.full(len(crit_ratings), versatility_rating))
+    return (np.concatenate(crits), np.concatenate(hastes), np.concatenate(versatilities),
+            np.concatenate(kill_times))
+
+
+def optimize(intellect, budget, step=25, mob_hp=500000, objective='dps', finalists=16, iterations=20000, seed=0,
+             workers=None):
+    """Searches crit/haste/mastery/versatility allocations of budget rating for the best DPS or time-to-kill.
+
+    Every allocation is screened with the analytic expected kill time. Only the finalists best by that estimate are
+    given full Monte Carlo runs, all with the same seed so their comparison is not swamped by crit noise. Finalists
+    are spread across a process pool of workers processes; workers=1 runs them in this process."""
+    if objective not in OBJECTIVES:
+        raise ValueError(f'objective must be one of {OBJECTIVES}')
+    crits, hastes, versatilities, expected = screen(intellect, budget, step, mob_hp)
+    best = np.argsort(expected, kind='stable')[:finalists]
+    profiles = [(intellect, int(crits[i]), int(hastes[i]), int(budget - crits[i] - hastes[i] - versatilities[i]),
+                 int(versatilities[i])) for i in best]
+    stats = [Stats(*profile) for profile in profiles]
+    args = ([iterations]*len(stats), [mob_hp]*len(stats), [seed]*len(stats))
+    if workers == 1:
+        results = list(map(vectorized_kill_times, stats, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(vectorized_kill_times, stats, *args))
+    summaries = [BatchSummary.from_kill_times(kill_times, mob_hp, 0.95, (5, 25, 50, 75, 95))
+                 for kill_times in results]
+    ranked = list(zip(profiles, expected[best].tolist(), summaries))
+    if objective == 'dps':
+        ranked.sort(key=lambda finalist: -finalist[2].dps.mean)
+    else:
+        ranked.sort(key=lambda finalist: finalist[2].time_to_kill.mean)
+    return OptimizerResult(objective, len(expected), ranked)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from multiprocessing.util import Finalize, register_after_fork
+from apl import DEFAULT_APL
+from engine import ENGINE_VERSION
+
+# Path of the SQLite file results are kept in. Unset, nothing is stored.
+RESULT_STORE_PATH = os.environ.get('WOWSIM_RESULT_STORE')
+
+
+def result_key(stats, iterations, mob_hp, seed, confidence, percentiles, apl=None, precision=None,
+               max_iterations=100000):
+    """A hash of everything a seeded run_batch summary depends on.
+
+    The mode is left out since both modes give the same kill times for the same seed. max_iterations only matters
+    with a precision target, since a fixed batch never reaches it."""
+    apl = DEFAULT_APL if apl is None else apl
+    ratings = (stats.intellect, stats.crit_rating, stats.haste_rating, stats.mastery_rating, stats.versatility_rating)
+    parts = [ENGINE_VERSION, apl.table.digest, list(apl.entries), [float(rating) for rating in ratings], seed,
+             iterations, mob_hp, confidence, list(percentiles), precision,
+             None if precision is None else max_iterations]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class SQLiteStore:
+    """An SQLite file that every thread and process opening path shares, through one connection per thread."""
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+        # A forked worker gets its own connections. Process pools clear the finalizers of their workers after
+        # os-level fork hooks run, so subclasses that register one in reset get theirs back afterwards.
+        os.register_at_fork(after_in_child=self.reset)
+        register_after_fork(self, type(self).reset)
+
+    def reset(self):
+        self.local = threading.local()
+
+    def connection(self):
+        """This thread's connection. SQLite connections cannot be shared between threads."""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=30)
+            # Readers in other processes are not blocked while a batch is written.
+            db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+
+class ResultStore(SQLiteStore):
+    """Batch summaries kept in an SQLite file, so every process of every app instance pointed at the same file shares
+    what any one of them has simulated.
+
+    Puts are held in memory and written batch_size at a time in one transaction, or flush_interval seconds after the
+    first one waiting, whichever comes first. Rows are tagged with ENGINE_VERSION and those of any other version are
+    deleted when a store is opened, so a change to the engine never serves stale results. hits and misses are counted
+    per process, like an LRUCache's."""
+    def __init__(self, path, batch_size=32, flush_interval=5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        super().__init__(path)
+        with self.connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, engine_version INTEGER NOT NULL, '
+                       'value TEXT NOT NULL, created REAL NOT NULL)')
+            db.execute('DELETE FROM results WHERE engine_version != ?', (ENGINE_VERSION,))
+
+    def reset(self):
+        super().reset()
+        self.lock = threading.Lock()
+        # Anything inherited from a parent process is the parent's to write.
+        self.pending = {}
+        self.timer = None
+        # Unlike atexit, this also runs when a process pool shuts its workers down.
+        Finalize(None, self.flush, exitpriority=0)
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.pending.get(key)
+        if row is None:
+            row = self.connection().execute('SELECT value FROM results WHERE key = ? AND engine_version = ?',
+                                            (key, ENGINE_VERSION)).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """Stores value, which has to be JSON serializable, under key once the current batch is written."""
+        with self.lock:
+            self.pending[key] = (json.dumps(value),)
+            if len(self.pending) < self.batch_size:
+                if self.timer is None:
+                    # Long-lived processes write their last puts without waiting for a full batch or for exit.
+                    self.timer = threading.Timer(self.flush_interval, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """Writes every pending put in one transaction."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not pending:
+            return
+        now = time.time()
+        with self.connection() as db:
+            db.executemany('INSERT OR REPLACE INTO results (key, engine_version, value, created) VALUES (?, ?, ?, ?)',
+                           [(key, ENGINE_VERSION, value, now) for key, (value,) in pending.items()])
+
+    def __len__(self):
+        return self.connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def stats(self):
+        return {'size': len(self), 'maxsize': None, 'hits': self.hits, 'misses': self.misses}
+
+
+# The store run_batch reads seeded results from. Set WOWSIM_RESULT_STORE to a file path to turn it on.
+result_store = ResultStore(RESULT_STORE_PATH) if RESULT_STORE_PATH else None
@@ -0,0 +1,66 @@
+import itertools
+import numpy as np
+
+# SplitMix64's increment. Stream j of a key is the finalizer applied to key + (j+1)*GAMMA, so any roll of any run can
+# be computed on its own, in any order and on any worker.
+GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+# Substreams of a run. Mob hitpoints come from their own substream so that they never shift the crit rolls.
+CRITS = 0
+MOBS = 1
+
+
+def _mix(z):
+    """SplitMix64's finalizer, applied elementwise to a uint64 array."""
+    z = (z ^ (z >> 30))*np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> 27))*np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> 31)
+
+
+def seed_key(seed=None):
+    """The 64-bit key of a seed. None draws a fresh key from the OS."""
+    return int(np.random.SeedSequence(seed).generate_state(1, np.uint64)[0])
+
+
+def stream_keys(key, runs, substream=CRITS):
+    """The key of substream of each run in runs, hashed so that neighbouring runs get unrelated streams."""
+    runs = np.asarray(runs, dtype=np.uint64)
+    return _mix(_mix(np.uint64(key) + (runs + 1)*GAMMA) ^ np.uint64(substream))
+
+
+def uniforms(keys, start, count):
+    """Rolls start to start+count of each stream in keys as a (len(keys), count) array of floats in [0, 1)."""
+    counters = np.arange(start + 1, start + count + 1, dtype=np.uint64)
+    z = _mix(np.asarray(keys, dtype=np.uint64)[:, None] + counters*GAMMA)
+    return (z >> 11)*(1.0/(1 << 53))
+
+
+def crit_rolls(key, runs, hits):
+    """The first hits crit rolls of every run in runs, one row per run."""
+    return uniforms(stream_keys(key, runs, CRITS), 0, hits)
+
+
+class CritStream:
+    """The random numbers of one run of a seeded batch, for Simulation's rng.
+
+    Roll j of run r depends only on the seed, r and j, and is the same number crit_rolls gives the vectorized path, so
+    results reproduce bit for bit however runs are split across chunks and workers. Rolls are drawn block_size at a
+    time and random is the C-level __next__ of a chain over those blocks, so taking a roll costs no Python frame."""
+    __slots__ = ('key', 'run', 'block_size', 'random', 'mob_random')
+
+    def __init__(self, seed=None, run=0, block_size=256, key=None):
+        self.key = seed_key(seed) if key is None else key
+        self.run = run
+        self.block_size = block_size
+        self.random = itertools.chain.from_iterable(self.blocks(CRITS)).__next__
+        self.mob_random = itertools.chain.from_iterable(self.blocks(MOBS)).__next__
+
+    def blocks(self, substream):
+        """Yields the rolls of one of the run's substreams a block at a time."""
+        keys = stream_keys(self.key, [self.run], substream)
+        for start in itertools.count(0, self.block_size):
+            yield uniforms(keys, start, self.block_size)[0].tolist()
+
+    def randrange(self, start, stop):
+        """A random integer from start up to stop, drawn from the run's mob substream."""
+        return start + int(self.mob_random()*(stop - start))
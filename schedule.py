@@ -0,0 +1,236 @@
+import numpy as np
+from apl import DEFAULT_APL
+from cache import LRUCache
+from engine import MAX_FIGHT_DURATION, Simulation, Spellbook
+from instrumentation import metrics
+from rng import crit_rolls, seed_key
+from spelltable import SPELL_TABLE
+
+# Coefficients of the Abramowitz and Stegun 7.1.26 approximation of erf, good to 1.5e-7.
+ERF_P = 0.3275911
+ERF_COEFFS = (1.061405429, -1.453152027, 1.421413741, -0.284496736, 0.254829592)
+# Standard deviations below the mean within which a hit can be the killing one. Further out the chance is under 1e-19.
+KILL_WINDOW = 9
+# kill_times samples runs in chunks of about this many bytes. Each hit of each run in a chunk takes about
+# BYTES_PER_HIT across the rolls, crit flags, damage and running totals, so long fights get fewer runs per chunk.
+CHUNK_BYTES = 4*2**20
+BYTES_PER_HIT = 48
+
+
+def normal_cdf(z):
+    """The standard normal CDF of every value of the array z at once."""
+    x = np.abs(z)/np.sqrt(2)
+    t = 1/(1 + ERF_P*x)
+    polynomial = np.zeros_like(t)
+    for coeff in ERF_COEFFS:
+        polynomial = (polynomial + coeff)*t
+    tail = 0.5*polynomial*np.exp(-x*x)
+    return np.where(z < 0, tail, 1 - tail)
+
+
+class ScheduleRecorder(Simulation):
+    """A Simulation that records when each hit lands instead of rolling crits and dealing damage.
+
+    The rotation never looks at damage or crits, so the hits it records are the hits every run with the same haste
+    will make, in the same order. Recordings are not fights, so they are left out of metrics."""
+    __slots__ = ('duration', 'times', 'spell_ids', 'schism_flags', 'coeffs', 'cast_flags')
+
+    instrumented = False
+
+    def __init__(self, stats, duration, apl=None):
+        super().__init__(stats, apl=apl)
+        self.duration = duration
+        self.times = []
+        self.spell_ids = []
+        self.schism_flags = []
+        self.coeffs = []
+        self.cast_flags = []
+
+    def hit(self, spell, spell_damage, coeff=1):
+        self.times.append(self.now)
+        self.spell_ids.append(spell)
+        self.schism_flags.append(self.now <= self.debuff_end)
+        self.coeffs.append(coeff)
+        # hit_counts still holds the hits before this one, so the first hit of a cast finds it at 0.
+        self.cast_flags.append(not self.table.periodic[spell] and not self.hit_counts[spell])
+
+
+class CastSchedule:
+    """The hits of one run as parallel arrays: time, spell id, Schism debuff flag, damage coefficient and whether the
+    hit is the first of a cast.
+
+    Only haste changes the schedule, so one CastSchedule serves every intellect, crit and versatility value. Spell ids
+    are rows of table, the SpellTable the schedule was recorded with."""
+    def __init__(self, haste_percent, duration, times, spell_ids, schism_flags, coeffs, cast_flags, table=None):
+        self.haste_percent = haste_percent
+        self.table = SPELL_TABLE if table is None else table
+        self.duration = duration
+        self.times = times
+        self.spell_ids = spell_ids
+        self.schism_flags = schism_flags
+        self.coeffs = coeffs
+        self.cast_flags = cast_flags
+
+    def __len__(self):
+        return len(self.times)
+
+    def hit_damage(self, stats, versatility_percent=None):
+        """Non-crit damage of every hit, computed exactly as Simulation.hit does.
+
+        versatility_percent overrides the value in stats. Passing an array of values returns one row per value."""
+        if versatility_percent is None:
+            versatility_percent = stats.versatility_percent
+        versatility_percent = np.asarray(versatility_percent, dtype=float)
+        spell_damage = np.array(Spellbook(stats, self.table).spell_damages())[self.spell_ids]
+        return (spell_damage*(1+versatility_percent[..., None])*(1+self.schism_flags*self.table.damage_taken)
+                * self.coeffs).astype(np.int64)
+
+    def covers(self, stats, mob_hp):
+        """Whether the schedule runs long enough to kill mob_hp even if nothing crits."""
+        return self.hit_damage(stats).sum() >= mob_hp
+
+    def kill_distribution(self, stats, mob_hp):
+        """Returns the time of every hit that can kill mob_hp and the approximate chance that it is the killing hit,
+        without sampling any crits.
+
+        The damage dealt up to hit k is a sum of independent crit rolls, which this treats as normal with mean
+        sum(base*(1+crit)) and variance sum(base**2*crit*(1-crit)). The chance the mob is dead by hit k is the chance
+        that sum reaches mob_hp, and hit k kills it with the difference from hit k-1. The approximation is close over
+        the tens of hits a kill takes, but ignores how lumpy the sum is over the last few. Hits before the sum comes
+        within KILL_WINDOW standard deviations of mob_hp are left out."""
+        damage = self.hit_damage(stats)
+        # No run can last longer than the one where nothing crits.
+        last_hit = int(np.searchsorted(np.cumsum(damage), mob_hp))
+        if last_hit >= len(damage):
+            raise ValueError('The schedule is too short to kill the mob. Build it with a longer duration.')
+        damage = damage[:last_hit + 1].astype(float)
+        crit_chance = stats.crit_chance
+        mean = np.cumsum(damage*(1+crit_chance))
+        std = np.sqrt(np.cumsum(damage*damage)*crit_chance*(1-crit_chance))
+        # Both sums only grow, so the hits that can kill are the ones from where the first comes within reach.
+        first_hit = int(np.searchsorted(mean + KILL_WINDOW*std, mob_hp))
+        mean, std = mean[first_hit:], std[first_hit:]
+        dead = (mean >= mob_hp).astype(float)
+        spread = std > 0
+        dead[spread] = normal_cdf((mean[spread] - mob_hp)/std[spread])
+        dead[-1] = 1.0
+        dead = np.maximum.accumulate(dead)
+        dead[1:] -= dead[:-1].copy()
+        return self.times[first_hit:last_hit + 1], dead
+
+    def sample_run(self, stats, mob_hp, seed=None, run=0):
+        """Samples the crits of a single run and returns the time, spell id, damage and crit flag of every hit up to the
+        kill.
+
+        The crits are those of the same run of kill_times, or of the event engine with a CritStream, and seed."""
+        damage = self.hit_damage(stats)
+        rolls = crit_rolls(seed_key(seed), [run], len(damage))[0]
+        crits = rolls*(stats.crit_chance + (1-stats.crit_chance)) < stats.crit_chance
+        damage = damage*(1+crits)
+        kill_hit = int(np.searchsorted(np.cumsum(damage), mob_hp))
+        if kill_hit >= len(damage):
+            raise ValueError('The schedule is too short to kill the mob. Build it with a longer duration.')
+        end = kill_hit + 1
+        if metrics.enabled:
+            self.count_hits(np.ones(end), crits[:end])
+        return self.times[:end], self.spell_ids[:end], damage[:end], crits[:end]
+
+    def count_hits(self, reached, crits):
+        """Adds the hits, crits and casts of sampled runs to metrics. reached[j] is how many runs made hit j and
+        crits[j] how many of those crit on it."""
+        spell_ids = self.spell_ids[:len(reached)]
+        size = len(self.table)
+        totals = (('wowsim_spell_hits_total', np.bincount(spell_ids, reached, size)),
+                  ('wowsim_spell_crits_total', np.bincount(spell_ids, crits, size)),
+                  ('wowsim_spell_casts_total', np.bincount(spell_ids, reached*self.cast_flags[:len(reached)], size)))
+        for name, counts in totals:
+            for spell, count in enumerate(counts.tolist()):
+                if count:
+                    metrics.count(name, int(count), spell=self.table.names[spell])
+
+    def kill_times(self, stats, mob_hp, iterations, seed=None, chunk_size=None, first_run=0):
+        """Samples crits for iterations runs at once, numbered from first_run, and returns the time each run kills the
+        mob.
+
+        Runs are sampled chunk_size at a time, by default as many as fit in CHUNK_BYTES, so peak memory stays the same
+        however long the fight is.
+
+        The crit roll of hit j in run r comes from rng.crit_rolls and depends only on seed, r and j, so chunk_size and
+        the way runs are split across workers never change the result. Profiles with different stats share random
+        numbers hit for hit, which is what keeps finite differences between them from drowning in noise."""
+        damage = self.hit_damage(stats)
+        # No run can last longer than the one where nothing crits.
+        last_hit = int(np.searchsorted(np.cumsum(damage), mob_hp))
+        if last_hit >= len(damage):
+            raise ValueError('The schedule is too short to kill the mob. Build it with a longer duration.')
+        damage = damage[:last_hit + 1]
+        crit_total = stats.crit_chance + (1-stats.crit_chance)
+        if chunk_size is None:
+            chunk_size = max(1, CHUNK_BYTES//(BYTES_PER_HIT*len(damage)))
+        kill_times = np.empty(iterations)
+        key = seed_key(seed)
+        counting = metrics.enabled
+        if counting:
+            reached = np.zeros(len(damage))
+            crit_counts = np.zeros(len(damage))
+        for start in range(0, iterations, chunk_size):
+            rows = min(chunk_size, iterations - start)
+            rolls = crit_rolls(key, np.arange(first_run + start, first_run + start + rows), len(damage))
+            crits = rolls*crit_total < stats.crit_chance
+            cumulative = np.cumsum(damage*(1+crits), axis=1)
+            # Offsetting each row by more than any row total makes the flattened array sorted, so one searchsorted
+            # finds the killing hit of every run.
+            row_numbers = np.arange(rows)
+            offsets = row_numbers*(2*int(damage.sum()) + 1)
+            kill_hits = (np.searchsorted((cumulative + offsets[:, None]).ravel(), offsets + mob_hp)
+                         - row_numbers*len(damage))
+            kill_times[start:start + rows] = self.times[kill_hits]
+            if counting:
+                # A run makes every hit up to its killing one, so counting runs by killing hit from the end gives how
+                # many runs made each hit.
+                reached += np.bincount(kill_hits, minlength=len(damage))[::-1].cumsum()[::-1]
+                crit_counts += (crits & (np.arange(len(damage)) <= kill_hits[:, None])).sum(axis=0)
+        if counting:
+            self.count_hits(reached, crit_counts)
+        return kill_times
+
+
+def build_schedule(stats, duration, apl=None):
+    """Records every hit that lands within duration seconds. Only stats.haste_percent and the priority list apl affect
+    the result."""
+    recorder = ScheduleRecorder(stats, duration, apl)
+    # The mob never loses any hitpoints, so the recording ends at until.
+    recorder.kill_one(1, until=duration)
+    return CastSchedule(stats.haste_percent, duration, np.array(recorder.times),
+                        np.array(recorder.spell_ids, dtype=np.int8), np.array(recorder.schism_flags),
+                        np.array(recorder.coeffs), np.array(recorder.cast_flags), recorder.table)
+
+
+def schedule_for(stats, mob_hp, duration=60.0, apl=None):
+    """Builds a schedule long enough to kill mob_hp, doubling the duration until it is. Raises ValueError once that
+    would take more than MAX_FIGHT_DURATION seconds."""
+    schedule = build_schedule(stats, duration, apl)
+    while not schedule.covers(stats, mob_hp):
+        if duration >= MAX_FIGHT_DURATION:
+            raise ValueError(f'The mob is not dead after {MAX_FIGHT_DURATION:,} seconds even without crits. The '
+                             'priority list may never cast a damaging spell.')
+        duration = min(2*duration, MAX_FIGHT_DURATION)
+        schedule = build_schedule(stats, duration, apl)
+    return schedule
+
+
+# Schedules keyed by haste_percent and priority list. Dash callbacks that change anything but haste reuse the cached
+# hit arrays and only recompute damage.
+schedule_cache = LRUCache(maxsize=64)
+metrics.register_cache('schedule', schedule_cache)
+
+
+def cached_schedule(stats, mob_hp, apl=None):
+    """Returns a schedule for stats.haste_percent and apl from schedule_cache, building or lengthening it on a miss."""
+    key = (stats.haste_percent, DEFAULT_APL if apl is None else apl)
+    schedule = schedule_cache.get(key)
+    if schedule is None or not schedule.covers(stats, mob_hp):
+        duration = 60.0 if schedule is None else schedule.duration
+        schedule = schedule_for(stats, mob_hp, duration, apl)
+        schedule_cache.put(key, schedule)
+    return schedule
@@ -0,0 +1,85 @@
+import sys
+from collections import defaultdict
+from hitlog import HitLog
+from spelltable import SPELL_TABLE
+
+
+class EventSink:
+    """Receives what happens in a fight. Subclasses override the events they care about.
+
+    Simulation only calls hit when wants_hits is true, so sinks that ignore hits add nothing to the hot loop."""
+    wants_hits = True
+
+    def hit(self, spell_name, time, damage, crit, mob_hp):
+        pass
+
+    def mob_spawned(self, mob_number, mob_hp, time):
+        pass
+
+    def mob_died(self, mob_number, time):
+        pass
+
+
+class NullSink(EventSink):
+    """Discards everything."""
+    wants_hits = False
+
+
+class CounterSink(EventSink):
+    """Counts hits, crits and damage per spell without keeping the hits themselves."""
+    def __init__(self):
+        self.hits = defaultdict(int)
+        self.crits = defaultdict(int)
+        self.damage = defaultdict(int)
+        self.mobs_killed = 0
+
+    def hit(self, spell_name, time, damage, crit, mob_hp):
+        self.hits[spell_name] += 1
+        self.crits[spell_name] += crit
+        self.damage[spell_name] += damage
+
+    def mob_died(self, mob_number, time):
+        self.mobs_killed += 1
+
+
+class ColumnarSink(EventSink):
+    """Keeps every hit in a HitLog of time, spell id, damage and crit flag columns.
+
+    Spell ids are rows of spell_names, by default those of SPELL_TABLE, so they match the ids the simulation uses."""
+    def __init__(self, capacity=256, spell_names=None):
+        self.log = HitLog(SPELL_TABLE.names if spell_names is None else spell_names, capacity=capacity)
+
+    def hit(self, spell_name, time, damage, crit, mob_hp):
+        self.log.append(time, self.log.spell_id(spell_name), damage, crit)
+
+    def __len__(self):
+        return len(self.log)
+
+
+class TextSink(EventSink):
+    """Writes a readable trace. verbosity 0 only reports mobs, 1 adds every hit and 2 adds the mob's HP after it.
+
+    A boss fought for a fixed time has no HP to report."""
+    def __init__(self, verbosity=2, stream=None):
+        self.verbosity = verbosity
+        self.boss = False
+        self.stream = sys.stdout if stream is None else stream
+        self.wants_hits = verbosity > 0
+
+    def hit(self, spell_name, time, damage, crit, mob_hp):
+        if crit:
+            self.stream.write(f'{spell_name} crit for {damage} at {time:.2f}s.\n')
+        else:
+            self.stream.write(f'{spell_name} hit for {damage} at {time:.2f}s.\n')
+        if self.verbosity > 1 and not self.boss:
+            self.stream.write(f'Mob HP: {max(mob_hp, 0)}.\n')
+
+    def mob_spawned(self, mob_number, mob_hp, time):
+        self.boss = mob_hp is None
+        if self.boss:
+            self.stream.write(f'Mob {mob_number} is a boss fought for a fixed time.\n')
+        else:
+            self.stream.write(f'Mob {mob_number} HP: {mob_hp}.\n')
+
+    def mob_died(self, mob_number, time):
+        self.stream.write(f'Mob {mob_number} died at {time:.2f}.\n')
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+
+SPELLS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spells.json')
+
+
+class SpellTable:
+    """Spell definitions compiled into struct-of-arrays form: one tuple per field, indexed by spell id.
+
+    A spell's id is its row in the table and doubles as the id of its hits in schedule.py and HitLog. Each row of the
+    JSON holds a key, the name reported with its hits and these optional fields:
+
+    - sp_weight and sp_bias: a cast deals sp_weight*intellect + sp_bias, split evenly over its hits.
+    - cast_time: hasted seconds between choosing the spell and its first hit.
+    - cooldown: seconds from the first hit until it can be cast again.
+    - hits: hits per cast, channel_duration hasted seconds over which they land or hit_interval unhasted seconds
+      between them.
+    - then: 'next_spell' to choose the next spell after the last hit, or 'gcd' to do so one GCD after the first hit.
+      gcd overrides the table's hasted GCD with a fixed number of seconds.
+    - debuff: {'duration', 'damage_taken'}, a debuff raising all damage taken while it lasts.
+    - applies: the key of a periodic row that the first hit starts or refreshes.
+    - periodic rows tick every hasted tick_interval for duration seconds and deal a partial last tick on last_event.
+      damage_of makes them tick for another row's damage instead of their own.
+    - event and last_event name the queue events of a row, key + '_hit' by default; event_order gives the order in
+      which events due at the same time are resolved.
+
+    Two numbers are kept as the app has always had them: SW: Pain ticks for the damage of its direct hit, and the GCD
+    after Divine Star is 0. Divine Star's return hit is estimated to land 1.5 seconds after the first, and haste seems
+    to have no effect on it."""
+    __slots__ = ('keys', 'names', 'labels', 'events', 'last_events', 'sp_weights', 'sp_biases', 'cast_times',
+                 'cooldowns', 'hits', 'channel_durations', 'hit_intervals', 'next_spell', 'gcds', 'debuff_durations',
+                 'damage_taken', 'applies', 'periodic', 'durations', 'tick_intervals', 'damage_of', 'gcd',
+                 'event_order', 'event_spells', 'digest')
+
+    def __init__(self, definition):
+        rows = definition['spells']
+        # Identifies the table's contents, for keying stored results.
+        self.digest = hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+        self.keys = tuple(row['key'] for row in rows)
+        ids = {key: spell_id for spell_id, key in enumerate(self.keys)}
+        if len(ids) != len(rows):
+            raise ValueError('Every spell in the table needs its own key.')
+
+        def row_id(row, field):
+            key = row.get(field)
+            if key is not None and key not in ids:
+                raise ValueError(f'{row["key"]}: {field} names unknown spell {key!r}.')
+            return None if key is None else ids[key]
+
+        self.names = tuple(row['name'] for row in rows)
+        self.labels = tuple(row.get('label', row['name']) for row in rows)
+        self.events = tuple(row.get('event', row['key'] + '_hit') for row in rows)
+        self.last_events = tuple(row.get('last_event') for row in rows)
+        self.sp_weights = tuple(row.get('sp_weight', 0) for row in rows)
+        self.sp_biases = tuple(row.get('sp_bias', 0) for row in rows)
+        self.cast_times = tuple(row.get('cast_time', 0) for row in rows)
+        self.cooldowns = tuple(row.get('cooldown', 0) for row in rows)
+        self.hits = tuple(row.get('hits', 1) for row in rows)
+        self.channel_durations = tuple(row.get('channel_duration') for row in rows)
+        self.hit_intervals = tuple(row.get('hit_interval', 0) for row in rows)
+        self.next_spell = tuple(row.get('then') == 'next_spell' for row in rows)
+        self.gcds = tuple(row.get('gcd', 'gcd') if row.get('then') == 'gcd' else None for row in rows)
+        self.debuff_durations = tuple(row.get('debuff', {}).get('duration', 0) for row in rows)
+        self.applies = tuple(row_id(row, 'applies') for row in rows)
+        self.periodic = tuple(row.get('periodic', False) for row in rows)
+        self.durations = tuple(row.get('duration', 0) for row in rows)
+        self.tick_intervals = tuple(row.get('tick_interval', 0) for row in rows)
+        self.damage_of = tuple(row_id(row, 'damage_of') for row in rows)
+        self.gcd = definition['gcd']
+        debuffs = {row['debuff']['damage_taken'] for row in rows if 'debuff' in row}
+        if len(debuffs) > 1:
+            raise ValueError('Every debuff in the table has to raise damage taken by the same amount.')
+        self.damage_taken = debuffs.pop() if debuffs else 0
+        for spell_id, applied in enumerate(self.applies):
+            if applied is not None and not self.periodic[applied]:
+                raise ValueError(f'{self.keys[spell_id]} applies {self.keys[applied]}, which is not periodic.')
+            if self.periodic[spell_id] and self.last_events[spell_id] is None:
+                raise ValueError(f'{self.keys[spell_id]} is periodic and needs a last_event.')
+
+        # Every queue event, the spell it belongs to and whether it is a partial last tick.
+        self.event_spells = {}
+        for spell_id, event in enumerate(self.events):
+            self.event_spells[event] = (spell_id, False)
+            if self.last_events[spell_id] is not None:
+                self.event_spells[self.last_events[spell_id]] = (spell_id, True)
+        self.event_order = tuple(definition['event_order'])
+        if (len(set(self.event_order)) != len(self.event_order)
+                or set(self.event_order) != set(self.event_spells) | {'gcd_end'}):
+            raise ValueError('event_order has to list every spell event and gcd_end exactly once.')
+
+    @classmethod
+    def load(cls, path=SPELLS_PATH):
+        with open(path) as table_file:
+            return cls(json.load(table_file))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def castable(self):
+        """Ids of the spells a rotation can cast, which is every row but the periodic ones."""
+        return [spell_id for spell_id in range(len(self)) if not self.periodic[spell_id]]
+
+    def ready_index(self, spell_id):
+        """The entry of Simulation.ready that says when spell_id can be cast again.
+
+        Spells that apply a periodic effect are ready when it runs out, the rest when their cooldown does."""
+        applied = self.applies[spell_id]
+        return spell_id if applied is None else applied
+
+
+SPELL_TABLE = SpellTable.load()
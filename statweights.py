@@ -0,0 +1,65 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from engine import PROFILE_FIELDS, Stats
+from schedule import schedule_for
+
+# Mastery has no effect on the damage spells simulated here, so it always has a weight of zero and is not run.
+WEIGHTED_STATS = ('intellect', 'crit_rating', 'haste_rating', 'versatility_rating')
+
+
+class StatWeights:
+    """DPS gained per point of each stat, with the standard error of each weight."""
+    def __init__(self, baseline_dps, weights, errors, delta, iterations):
+        self.baseline_dps = baseline_dps
+        self.weights = weights
+        self.errors = errors
+        self.delta = delta
+        self.iterations = iterations
+
+    def relative(self, reference='intellect'):
+        """Weights scaled so that the reference stat is worth 1.0."""
+        return {stat: weight/self.weights[reference] for stat, weight in self.weights.items()}
+
+    def as_dict(self):
+        return {'baseline_dps': self.baseline_dps, 'delta': self.delta, 'iterations': self.iterations,
+                'weights': self.weights, 'errors': self.errors}
+
+
+def profile_dps(profile, mob_hp, iterations, seed):
+    """DPS of every run of one profile. Every profile gets the same seed so runs line up across profiles."""
+    stats = Stats(*profile)
+    kill_times = schedule_for(stats, mob_hp).kill_times(stats, mob_hp, iterations, seed)
+    return mob_hp/kill_times
+
+
+def stat_weights(intellect, crit_rating, haste_rating, mastery_rating, versatility_rating, delta=100,
+                 iterations=10000, mob_hp=500000, seed=0, workers=None):
+    """Estimates stat weights by finite differences from the given stats, the same inputs make_dash takes.
+
+    The baseline and each +delta profile are run with common random numbers, so the paired per-run DPS differences
+    cancel most of the crit noise. Profiles are spread across a process pool of workers processes; workers=1 runs
+    them in this process."""
+    baseline = (intellect, crit_rating, haste_rating, mastery_rating, versatility_rating)
+    profiles = [baseline]
+    for stat in WEIGHTED_STATS:
+        profile = list(baseline)
+        profile[PROFILE_FIELDS.index(stat)] += delta
+        profiles.append(tuple(profile))
+    args = ([mob_hp]*len(profiles), [iterations]*len(profiles), [seed]*len(profiles))
+    if workers == 1:
+        results = list(map(profile_dps, profiles, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(profile_dps, profiles, *args))
+
+    baseline_dps = results[0]
+    weights = {}
+    errors = {}
+    for stat, dps in zip(WEIGHTED_STATS, results[1:]):
+        difference = (dps - baseline_dps)/delta
+        weights[stat] = float(difference.mean())
+        errors[stat] = float(difference.std(ddof=1)/math.sqrt(iterations))
+    weights['mastery_rating'] = 0.0
+    errors['mastery_rating'] = 0.0
+    return StatWeights(float(np.mean(baseline_dps)), weights, errors, delta, iterations)
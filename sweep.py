@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import tempfile
+import time
+import uuid
+from functools import partial
+import numpy as np
+from engine import PROFILE_FIELDS, Stats
+from montecarlo import run_batch
+from resultstore import SQLiteStore
+
+# Stats a sweep can vary, with the label shown on its axis.
+SWEEP_STATS = {'intellect': 'Intellect',
+               'crit_rating': 'Crit Rating',
+               'haste_rating': 'Haste Rating',
+               'mastery_rating': 'Mastery Rating',
+               'versatility_rating': 'Versatility Rating'}
+
+
+def sweep_values(center, step, points):
+    """points ratings step apart around center, shifted up where they would go below zero."""
+    start = max(0, center - step*(points//2))
+    return [start + step*i for i in range(points)]
+
+
+def sweep_line(profile, fixed_stat, fixed_value, stat, values, iterations, mob_hp, seed):
+    """Mean DPS of profile with fixed_stat set to fixed_value and stat set to each of values.
+
+    This is one job of a Sweep. Every cell of a line shares its haste, so they all cast from the one schedule the
+    worker builds for it. All cells use the same seed, so neighbours differ by their stats rather than by crit noise."""
+    profile = list(profile)
+    profile[PROFILE_FIELDS.index(fixed_stat)] = fixed_value
+    dps = []
+    for value in values:
+        profile[PROFILE_FIELDS.index(stat)] = value
+        dps.append(run_batch(Stats(*profile), iterations, mob_hp, seed).dps.mean)
+    return dps
+
+
+class Sweep:
+    """A grid of mean DPS over two stats, computed one line of cells per job in a process pool.
+
+    Cells are grouped into lines that share a haste rating: columns when haste is on the x axis or on neither, rows
+    when it is on the y axis. dps holds NaN for the cells that are not done yet, so partial grids can be shown while
+    the rest is still running."""
+    def __init__(self, x_stat, x_values, y_stat, y_values):
+        if x_stat not in SWEEP_STATS or y_stat not in SWEEP_STATS:
+            raise ValueError(f'Sweeps can only vary {", ".join(SWEEP_STATS)}.')
+        if x_stat == y_stat:
+            raise ValueError('A sweep needs two different stats.')
+        self.x_stat = x_stat
+        self.x_values = list(x_values)
+        self.y_stat = y_stat
+        self.y_values = list(y_values)
+        self.dps = np.full((len(self.y_values), len(self.x_values)), np.nan)
+        # Lines run along the axis that is not haste, so each one needs a single schedule.
+        self.by_rows = y_stat == 'haste_rating'
+        if self.by_rows:
+            self.lines = [(y_stat, y_value, x_stat, self.x_values) for y_value in self.y_values]
+        else:
+            self.lines = [(x_stat, x_value, y_stat, self.y_values) for x_value in self.x_values]
+        self.finished = set()
+
+    def submit(self, pool, profile, on_line, iterations=200, mob_hp=500000, seed=0):
+        """Submits one sweep_line job per line of profile's grid to pool.
+
+        As each line finishes, on_line(index, dps) is called with its mean DPS from a thread of this process, with NaN
+        for every cell if the job failed. Once it returns False, the lines that have not started are cancelled."""
+        futures = []
+
+        def finished(index, future):
+            if future.cancelled():
+                return
+            try:
+                dps = future.result()
+            except Exception:
+                dps = [math.nan]*len(self.lines[index][3])
+            if not on_line(index, dps):
+                for other in futures:
+                    other.cancel()
+
+        for index, line in enumerate(self.lines):
+            future = pool.submit(sweep_line, profile, *line, iterations, mob_hp, seed)
+            futures.append(future)
+            future.add_done_callback(partial(finished, index))
+
+    def fill(self, index, dps):
+        """Puts the mean DPS of a finished line into the grid."""
+        if self.by_rows:
+            self.dps[index, :] = dps
+        else:
+            self.dps[:, index] = dps
+        self.finished.add(index)
+
+    @property
+    def done(self):
+        return len(self.finished) == len(self.lines)
+
+    @property
+    def finished_cells(self):
+        return int(np.count_nonzero(~np.isnan(self.dps)))
+
+    def best(self):
+        """The x value, y value and DPS of the best finished cell, or None while no cell has finished."""
+        if not self.finished_cells:
+            return None
+        row, column = np.unravel_index(int(np.nanargmax(self.dps)), self.dps.shape)
+        return self.x_values[column], self.y_values[row], float(self.dps[row, column])
+
+    def z(self):
+        """dps as nested lists with None for unfinished cells, the shape a plotly heatmap takes."""
+        return [[None if math.isnan(dps) else round(dps, 1) for dps in row] for row in self.dps.tolist()]
+
+
+class SweepStore(SQLiteStore):
+    """The sweep each session is running and the lines it has finished, kept in an SQLite file so that any Gunicorn
+    worker can answer a page's polls, whichever one started the sweep.
+
+    A session has one sweep at a time and starting another replaces it. The process running a sweep writes each line
+    as it finishes, and cancels the rest once the sweep has been replaced or its page has stopped polling for ttl
+    seconds. Such abandoned sweeps are deleted when the next one starts. An unfinished sweep is reported as lost once
+    abandoned, or when no line has finished for stall seconds, as when the process running it was restarted."""
+    def __init__(self, path, ttl=60.0, stall=120.0):
+        self.ttl = ttl
+        self.stall = stall
+        super().__init__(path)
+        with self.connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS sweeps (session TEXT PRIMARY KEY, sweep TEXT NOT NULL, '
+                       'grid TEXT NOT NULL, polled REAL NOT NULL, updated REAL NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS sweep_lines (sweep TEXT NOT NULL, line INTEGER NOT NULL, '
+                       'dps TEXT NOT NULL, PRIMARY KEY (sweep, line))')
+
+    def start(self, session, sweep, pool, profile, iterations=200, mob_hp=500000, seed=0):
+        """Makes sweep the session's current one and submits its lines to pool."""
+        sweep_id = uuid.uuid4().hex
+        grid = json.dumps([sweep.x_stat, sweep.x_values, sweep.y_stat, sweep.y_values])
+        now = time.time()
+        with self.connection() as db:
+            db.execute('DELETE FROM sweeps WHERE polled < ?', (now - self.ttl,))
+            # Lines of the expired sweeps and of the one this replaces.
+            db.execute('DELETE FROM sweep_lines WHERE sweep NOT IN (SELECT sweep FROM sweeps WHERE session != ?)',
+                       (session,))
+            db.execute('INSERT OR REPLACE INTO sweeps (session, sweep, grid, polled, updated) VALUES (?, ?, ?, ?, ?)',
+                       (session, sweep_id, grid, now, now))
+        sweep.submit(pool, profile, partial(self.finish_line, session, sweep_id), iterations, mob_hp, seed)
+
+    def finish_line(self, session, sweep_id, index, dps):
+        """Stores a finished line and returns whether the sweep is still wanted."""
+        now = time.time()
+        with self.connection() as db:
+            wanted = db.execute('UPDATE sweeps SET updated = ? WHERE session = ? AND sweep = ? AND polled >= ?',
+                                (now, session, sweep_id, now - self.ttl)).rowcount
+            if wanted:
+                db.execute('INSERT OR REPLACE INTO sweep_lines (sweep, line, dps) VALUES (?, ?, ?)',
+                           (sweep_id, index, json.dumps(dps)))
+        return bool(wanted)
+
+    def load(self, session):
+        """The session's current sweep with the lines finished so far, or None if it has none or it was lost."""
+        now = time.time()
+        with self.connection() as db:
+            row = db.execute('SELECT sweep, grid, polled, updated FROM sweeps WHERE session = ?', (session,)).fetchone()
+            if row is None:
+                return None
+            sweep_id, grid, polled, updated = row
+            db.execute('UPDATE sweeps SET polled = ? WHERE session = ?', (now, session))
+            lines = db.execute('SELECT line, dps FROM sweep_lines WHERE sweep = ?', (sweep_id,)).fetchall()
+        sweep = Sweep(*json.loads(grid))
+        for index, dps in lines:
+            sweep.fill(index, json.loads(dps))
+        # The rest of an abandoned sweep was cancelled, and a stalled one may never finish.
+        if not sweep.done and (polled < now - self.ttl or updated < now - self.stall):
+            return None
+        return sweep
+
+
+# Where sweeps are kept. Every app process on a machine shares the default file.
+SWEEP_STORE_PATH = os.environ.get('WOWSIM_SWEEP_STORE', os.path.join(tempfile.gettempdir(), 'wowsim_sweeps.sqlite3'))
@@ -0,0 +1,85 @@
+import pytest
+from apl import DEFAULT_PRIORITY, PriorityList
+from engine import Simulation, Stats
+from rng import CritStream
+from schedule import ScheduleRecorder, build_schedule
+
+STATS = Stats(7189, 1273, 473, 716, 331)
+# The first hits of the original discsim.py with the stats above, as spell@time.
+BASELINE_HITS = ('Schism@1.40;SW: Pain DD@1.40;Penance@2.80;SW: Pain DoT@3.27;Penance@3.43;Penance@4.05;Solace@4.05;'
+                 'SW: Pain DoT@5.14;Divine Star@5.45;Smite@6.86;Divine Star@6.95;SW: Pain DoT@7.01;Smite@8.26;'
+                 'SW: Pain DoT@8.88;Smite@9.66;SW: Pain DoT@10.75;Smite@11.06;Smite@12.47;Penance@12.47;'
+                 'SW: Pain DoT@12.62;Penance@13.09;Penance@13.71;SW: Pain DoT@14.49;Smite@15.11;SW: Pain DoT@16.36;'
+                 'Smite@16.52;Solace@16.52;SW: Pain DoT@17.40;SW: Pain DD@17.92;SW: Pain DoT@19.79;Smite@20.72;'
+                 'Divine Star@20.72;SW: Pain DoT@21.66;Smite@22.13;Penance@22.13;Divine Star@22.22;Penance@22.75;'
+                 'Penance@23.37;SW: Pain DoT@23.53;Smite@24.78')
+CONDITIONAL_LISTS = [
+    [{'spell': 'pain', 'if': ['pain_inactive']}, 'schism', 'penance', 'smite'],
+    # Penance is ready long before its condition holds, and then has to be cast as soon as Schism's debuff runs out.
+    ['schism', {'spell': 'penance', 'if': ['schism_inactive']}, 'smite'],
+    [{'spell': 'penance', 'if': ['schism_active']}, 'schism', {'spell': 'solace', 'if': ['schism_on_cooldown']},
+     'divine_star', 'smite'],
+    ['schism', {'spell': 'smite', 'if': ['schism_active']},
+     {'spell': 'pain', 'if': ['pain_inactive', 'schism_inactive']}, 'penance', 'solace'],
+]
+
+
+def reference_next_spell(apl):
+    """next_spell as a plain loop over the entries, testing every entry on every call."""
+    def next_spell(sim):
+        now = sim.now
+        for spell, conditions in apl.entries:
+            ready, kind, cast_spell, _ = apl.actions[spell]
+            if ready is not None and now < sim.ready[ready]:
+                continue
+            if all(eval(apl.conditions[name], {'sim': sim, 'now': now}) for name in conditions):
+                sim.queue.schedule(kind, now + (sim.cast_times[cast_spell] if cast_spell is not None else 0))
+                return
+        sim.queue.schedule('gcd_end', now + sim.gcd)
+    return next_spell
+
+
+def recorded_hits(apl, duration, next_spell=None):
+    recorder = ScheduleRecorder(STATS, duration, apl)
+    if next_spell is not None:
+        recorder.apl_next_spell = next_spell
+    recorder.kill_one(1, until=duration)
+    return recorder.times, recorder.spell_ids
+
+
+def test_default_list_reproduces_baseline_cast_order():
+    schedule = build_schedule(STATS, 25)
+    hits = ';'.join(f'{schedule.table.names[spell]}@{time:.2f}' for time, spell in zip(schedule.times,
+                                                                                        schedule.spell_ids))
+    assert hits == BASELINE_HITS
+
+
+@pytest.mark.parametrize('entries', [DEFAULT_PRIORITY] + CONDITIONAL_LISTS + [['schism', 'penance', 'solace']])
+def test_compiled_list_matches_reference(entries):
+    apl = PriorityList(entries)
+    assert recorded_hits(apl, 600) == recorded_hits(apl, 600, reference_next_spell(apl))
+
+
+@pytest.mark.parametrize('entries, message', [(['schism', 'flash_heal'], 'Unknown spell'),
+                                              (['pain_dot'], 'Unknown spell'),
+                                              ([{'spell': 'smite', 'if': ['smite_active']}], 'Unknown condition'),
+                                              ([], 'empty')])
+def test_bad_lists_are_rejected(entries, message):
+    with pytest.raises(ValueError, match=message):
+        PriorityList(entries)
+
+
+def test_list_without_filler_terminates():
+    apl = PriorityList(['schism', 'penance', {'spell': 'pain', 'if': ['pain_inactive']}])
+    assert 'gcd_end' in apl.source()
+    kill_time = Simulation(STATS, rng=CritStream(1), apl=apl).kill_one(200000)
+    assert 0 < kill_time < 600
+    times, spell_ids = recorded_hits(apl, 120)
+    assert {apl.table.names[spell] for spell in spell_ids} == {'Schism', 'Penance', 'SW: Pain DD', 'SW: Pain DoT'}
+
+
+def test_compiled_function_is_shared():
+    apl = PriorityList(['schism', 'smite'])
+    assert apl.compile() is apl.compile()
+    assert apl == PriorityList(['schism', 'smite'])
+    assert hash(apl) == hash(PriorityList(['schism', 'smite']))
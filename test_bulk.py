@@ -0,0 +1,31 @@
+import pytest
+from bulk import MAX_MOB_HP, parse_job, parse_jobs
+
+PROFILE = {'intellect': 7000, 'crit_rating': 1000, 'haste_rating': 1000, 'mastery_rating': 500,
+           'versatility_rating': 500}
+
+
+def test_profile_settings_override_request_defaults():
+    jobs = parse_jobs({'profiles': [PROFILE, dict(PROFILE, iterations=50, id='b')], 'iterations': 200, 'seed': 3})
+    assert [job['iterations'] for job in jobs] == [200, 50]
+    assert [job['seed'] for job in jobs] == [3, 3]
+    assert jobs[1]['id'] == 'b'
+    assert jobs[0]['profile'] == [7000, 1000, 1000, 500, 500]
+
+
+@pytest.mark.parametrize('setting, value', [('iterations', True), ('iterations', 0), ('iterations', 2.5),
+                                            ('seed', False), ('seed', -1), ('mob_hp', True),
+                                            ('mob_hp', MAX_MOB_HP + 1), ('precision', 1), ('mode', 'fast')])
+def test_bad_settings_are_rejected(setting, value):
+    with pytest.raises(ValueError):
+        parse_job(0, dict(PROFILE, **{setting: value}))
+
+
+@pytest.mark.parametrize('field, value', [('crit_rating', None), ('crit_rating', True), ('haste_rating', -1)])
+def test_bad_ratings_are_rejected(field, value):
+    with pytest.raises(ValueError):
+        parse_job(0, dict(PROFILE, **{field: value}))
+
+
+def test_null_seed_is_allowed():
+    assert parse_job(0, dict(PROFILE, seed=None))['seed'] is None
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from apl import PriorityList
+from encounter import encounter
+from engine import MAX_FIGHT_DURATION, Simulation, Stats
+from rng import CritStream
+from schedule import build_schedule
+from sinks import ColumnarSink, CounterSink
+
+STATS = Stats(7000, 1000, 1000, 500, 500)
+
+
+def simulation(apl=None, sink=None):
+    return Simulation(STATS, sink=sink, rng=CritStream(1), apl=apl)
+
+
+def test_mobs_carry_the_fight_over():
+    sink = ColumnarSink()
+    mobs = list(encounter(simulation(sink=sink), 50000, 80000, mobs=5))
+    assert [mob.number for mob in mobs] == [1, 2, 3, 4, 5]
+    assert all(mob.died and 50000 <= mob.hp <= 80000 for mob in mobs)
+    assert mobs[0].spawned == 0
+    assert all(mob.spawned == previous.ended for previous, mob in zip(mobs, mobs[1:]))
+    # Cooldowns, the DoT and the debuff carry over, so the hits land just as in one fight that never stops.
+    schedule = build_schedule(STATS, mobs[-1].ended)
+    assert np.array_equal(sink.log.times, schedule.times)
+    assert np.array_equal(sink.log.ids, schedule.spell_ids)
+
+
+def test_damage_stops_at_each_mobs_hp():
+    sink = CounterSink()
+    mobs = list(encounter(simulation(sink=sink), 50000, 80000, mobs=5))
+    assert all(mob.damage == mob.hp for mob in mobs)
+    assert any(mob.overkill > 0 for mob in mobs)
+    assert sum(mob.damage + mob.overkill for mob in mobs) == sum(sink.damage.values())
+    assert all(mob.dps == mob.hp/mob.duration for mob in mobs)
+    assert mobs[0].as_dict()['overkill'] == mobs[0].overkill
+
+
+def test_encounter_ends_alive_at_its_duration():
+    mobs = list(encounter(simulation(), 50000, 80000, duration=60))
+    assert all(mob.died for mob in mobs[:-1])
+    last = mobs[-1]
+    assert not last.died and last.ended == 60 and last.overkill == 0
+    assert 0 < last.damage < last.hp
+
+
+def test_boss_needs_a_duration():
+    with pytest.raises(ValueError):
+        next(encounter(simulation()))
+
+
+def test_mob_pack_runs_past_max_fight_duration():
+    # Each mob is a fight of its own, so the clock passing MAX_FIGHT_DURATION never gives up on one.
+    for mob in encounter(simulation(), 1000000, 1000000):
+        assert mob.died
+        if mob.ended > MAX_FIGHT_DURATION + 600:
+            break
+    assert mob.number > 500
+
+
+def test_boss_fight_runs_past_max_fight_duration():
+    duration = 2*MAX_FIGHT_DURATION
+    mobs = list(encounter(simulation(), duration=duration))
+    assert len(mobs) == 1
+    assert not mobs[0].died
+    assert mobs[0].ended == duration
+    assert mobs[0].damage > 0
+
+
+def test_fight_that_never_ends_gives_up_after_max_fight_duration():
+    # Schism is only cast while it is on cooldown, so nothing is ever cast.
+    sim = simulation(PriorityList([{'spell': 'schism', 'if': ['schism_on_cooldown']}]))
+    with pytest.raises(ValueError):
+        sim.kill_one(1000)
+    assert sim.now <= MAX_FIGHT_DURATION
+
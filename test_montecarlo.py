@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import montecarlo
+from engine import Stats
+from montecarlo import adaptive_kill_times, event_kill_times, run_batch, vectorized_kill_times
+from schedule import cached_schedule
+
+PROFILES = [Stats(7000, 1000, 1000, 500, 500),
+            Stats(6000, 2500, 300, 200, 1200),
+            Stats(8000, 0, 2000, 800, 0)]
+
+
+@pytest.fixture(autouse=True)
+def no_result_store(monkeypatch):
+    """Every batch is simulated, never read back from a store left over from another run."""
+    monkeypatch.setattr(montecarlo, 'result_store', None)
+
+
+@pytest.mark.parametrize('stats', PROFILES)
+@pytest.mark.parametrize('seed', [0, 12345])
+def test_event_matches_vectorized(stats, seed):
+    event = event_kill_times(stats, 50, 200000, seed)
+    vectorized = vectorized_kill_times(stats, 50, 200000, seed)
+    assert np.array_equal(event, vectorized)
+
+
+def test_event_matches_vectorized_from_first_run():
+    stats = PROFILES[0]
+    assert np.array_equal(event_kill_times(stats, 20, 200000, 7, first_run=30),
+                          vectorized_kill_times(stats, 20, 200000, 7, first_run=30))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1000])
+def test_kill_times_chunk_size_invariant(chunk_size):
+    stats = PROFILES[1]
+    schedule = cached_schedule(stats, 300000)
+    expected = schedule.kill_times(stats, 300000, 300, seed=42)
+    assert np.array_equal(schedule.kill_times(stats, 300000, 300, seed=42, chunk_size=chunk_size), expected)
+
+
+def test_kill_times_split_across_batches():
+    stats = PROFILES[2]
+    whole = vectorized_kill_times(stats, 300, 300000, 9)
+    parts = [vectorized_kill_times(stats, 100, 300000, 9, first_run=first_run) for first_run in (0, 100, 200)]
+    assert np.array_equal(np.concatenate(parts), whole)
+
+
+@pytest.mark.parametrize('mode', ['event', 'vectorized'])
+def test_adaptive_stop_matches_fixed_batch(mode):
+    stats = PROFILES[0]
+    adaptive = adaptive_kill_times(stats, 100, 200000, 3, None, mode, 0.005, 0.95, 5000)
+    assert 100 < len(adaptive) < 5000
+    fixed = montecarlo.MODES[mode](stats, len(adaptive), 200000, 3, None)
+    assert np.array_equal(adaptive, fixed)
+
+
+def test_adaptive_run_batch_matches_fixed_batch():
+    stats = PROFILES[1]
+    adaptive = run_batch(stats, 100, 200000, seed=5, precision=0.005, max_iterations=5000)
+    assert adaptive.converged
+    fixed = run_batch(stats, adaptive.iterations, 200000, seed=5)
+    assert adaptive.dps.mean == fixed.dps.mean
+    assert adaptive.time_to_kill.percentiles == fixed.time_to_kill.percentiles
+
+
+@pytest.mark.parametrize('stats', PROFILES)
+def test_expected_summary_tracks_sampled_means(stats):
+    expected = run_batch(stats, mob_hp=500000, expected_only=True)
+    sampled = run_batch(stats, 5000, 500000, seed=11)
+    assert expected.time_to_kill.mean == pytest.approx(sampled.time_to_kill.mean, rel=0.005)
+    assert expected.dps.mean == pytest.approx(sampled.dps.mean, rel=0.005)
+    assert expected.time_to_kill.std == pytest.approx(sampled.time_to_kill.std, rel=0.1)
@@ -0,0 +1,71 @@
+import pytest
+import montecarlo
+import resultstore
+from apl import PriorityList
+from engine import Stats
+from montecarlo import run_batch
+from resultstore import ResultStore, result_key
+
+STATS = Stats(7000, 1000, 1000, 500, 500)
+SETTINGS = {'iterations': 1000, 'mob_hp': 500000, 'seed': 0, 'confidence': 0.95, 'percentiles': (5, 50, 95)}
+
+
+def key(stats=STATS, **changes):
+    settings = dict(SETTINGS, **changes)
+    return result_key(stats, settings.pop('iterations'), settings.pop('mob_hp'), settings.pop('seed'),
+                      settings.pop('confidence'), settings.pop('percentiles'), **settings)
+
+
+@pytest.mark.parametrize('changes', [{'iterations': 1001}, {'mob_hp': 400000}, {'seed': 1}, {'confidence': 0.99},
+                                     {'percentiles': (5, 50)}, {'precision': 0.002},
+                                     {'apl': PriorityList(['schism', 'smite'])}])
+def test_key_changes_with_every_setting(changes):
+    assert key(**changes) != key()
+
+
+def test_key_changes_with_stats():
+    assert key(Stats(7000, 1001, 1000, 500, 500)) != key()
+    assert key(Stats(7000, 1000, 1000, 500, 500)) == key()
+
+
+def test_max_iterations_only_matters_with_a_precision_target():
+    assert key(max_iterations=5000) == key()
+    assert key(precision=0.002, max_iterations=5000) != key(precision=0.002)
+
+
+def test_key_changes_with_the_engine_version(monkeypatch):
+    before = key()
+    monkeypatch.setattr(resultstore, 'ENGINE_VERSION', resultstore.ENGINE_VERSION + 1)
+    assert key() != before
+
+
+def test_store_round_trip(tmp_path):
+    store = ResultStore(str(tmp_path/'results.sqlite3'), batch_size=2)
+    store.put('a', {'value': 1})
+    assert store.get('a') == {'value': 1}
+    store.flush()
+    assert ResultStore(str(tmp_path/'results.sqlite3')).get('a') == {'value': 1}
+    assert store.get('b') is None
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_other_engine_versions_are_dropped(tmp_path, monkeypatch):
+    path = str(tmp_path/'results.sqlite3')
+    store = ResultStore(path)
+    store.put('a', {'value': 1})
+    store.flush()
+    monkeypatch.setattr(resultstore, 'ENGINE_VERSION', resultstore.ENGINE_VERSION + 1)
+    store = ResultStore(path)
+    assert len(store) == 0
+    assert store.get('a') is None
+
+
+def test_run_batch_reads_seeded_results_back(tmp_path, monkeypatch):
+    store = ResultStore(str(tmp_path/'results.sqlite3'))
+    monkeypatch.setattr(montecarlo, 'result_store', store)
+    first = run_batch(STATS, 200, 200000, seed=4)
+    second = run_batch(STATS, 200, 200000, seed=4, mode='event')
+    assert (store.hits, store.misses) == (1, 1)
+    assert second.as_dict() == first.as_dict()
+    run_batch(STATS, 200, 200000)
+    assert (store.hits, store.misses) == (1, 1)
@@ -0,0 +1,84 @@
+import copy
+import json
+import pytest
+from apl import PriorityList
+from engine import Simulation, Spellbook, Stats
+from schedule import build_schedule
+from spelltable import SPELL_TABLE, SPELLS_PATH, SpellTable
+
+with open(SPELLS_PATH) as spells_file:
+    DEFINITION = json.load(spells_file)
+STATS = Stats(7000, 1000, 1000, 500, 500)
+
+
+def changed(change):
+    """A copy of the spells.json definition with change applied to it."""
+    definition = copy.deepcopy(DEFINITION)
+    change(definition)
+    return definition
+
+
+def spell(definition, key):
+    return next(row for row in definition['spells'] if row['key'] == key)
+
+
+def test_default_table():
+    assert SPELL_TABLE.names == ('Schism', 'SW: Pain DD', 'SW: Pain DoT', 'Penance', 'Solace', 'Divine Star', 'Smite')
+    assert SPELL_TABLE.castable() == [0, 1, 3, 4, 5, 6]
+    pain, pain_dot = SPELL_TABLE.keys.index('pain'), SPELL_TABLE.keys.index('pain_dot')
+    assert SPELL_TABLE.applies[pain] == pain_dot
+    assert SPELL_TABLE.ready_index(pain) == pain_dot
+    assert SPELL_TABLE.damage_taken == 0.4
+
+
+def rename_key(definition):
+    spell(definition, 'smite')['key'] = 'schism'
+
+
+def drop_last_event(definition):
+    del spell(definition, 'pain_dot')['last_event']
+
+
+def second_debuff(definition):
+    spell(definition, 'solace')['debuff'] = {'duration': 5, 'damage_taken': 0.1}
+
+
+def duplicate_event(definition):
+    definition['event_order'].append('smite_hit')
+
+
+@pytest.mark.parametrize('change, message', [
+    (rename_key, 'own key'),
+    (lambda definition: spell(definition, 'pain').update(applies='shadow_word_death'), 'unknown spell'),
+    (lambda definition: spell(definition, 'pain_dot').update(damage_of='mind_blast'), 'unknown spell'),
+    (lambda definition: spell(definition, 'pain').update(applies='smite'), 'not periodic'),
+    (drop_last_event, 'needs a last_event'),
+    (second_debuff, 'same amount'),
+    (lambda definition: definition['event_order'].remove('smite_hit'), 'event_order'),
+    (duplicate_event, 'event_order'),
+])
+def test_bad_tables_are_rejected(change, message):
+    with pytest.raises(ValueError, match=message):
+        SpellTable(changed(change))
+
+
+def test_digest_follows_the_definition():
+    assert SpellTable(copy.deepcopy(DEFINITION)).digest == SPELL_TABLE.digest
+    faster = SpellTable(changed(lambda definition: spell(definition, 'smite').update(cast_time=1.2)))
+    assert faster.digest != SPELL_TABLE.digest
+
+
+def test_table_changes_reach_the_rotation():
+    faster = SpellTable(changed(lambda definition: spell(definition, 'smite').update(cast_time=1.2)))
+    apl = PriorityList(['smite'], faster)
+    schedule = build_schedule(STATS, 30, apl)
+    default = build_schedule(STATS, 30, PriorityList(['smite']))
+    assert len(schedule) > len(default)
+    assert schedule.table is faster
+
+
+def test_spellbooks_and_lists_need_the_same_table():
+    other = SpellTable(copy.deepcopy(DEFINITION))
+    assert Simulation(STATS, apl=PriorityList(['smite'], other)).table is other
+    with pytest.raises(ValueError, match='different spell table'):
+        Simulation(Spellbook(STATS), apl=PriorityList(['smite'], other))